@@ -1,6 +1,6 @@
 from flask import Blueprint, jsonify, request, Response, session
 from tacacs_dashboard.services.log_parser import get_recent_events, get_summary, get_all_events
-from tacacs_dashboard.services.policy_store import load_policy, save_policy
+from tacacs_dashboard.services.policy_store import load_policy, load_policy_cached, save_policy
 from tacacs_dashboard.services.tacacs_config import build_config_text
 from tacacs_dashboard.services.access_control import allowed_device_group_ids, device_in_scope
 from tacacs_dashboard.services.device_groups_store import group_exists
@@ -54,15 +54,15 @@ def api_policy_all():
 
 @bp.get("/users")
 def api_users():
-    return jsonify(load_policy().get("users", []))
+    return jsonify(load_policy_cached().get("users", []))
 
 @bp.get("/roles")
 def api_roles():
-    return jsonify(load_policy().get("roles", []))
+    return jsonify(load_policy_cached().get("roles", []))
 
 @bp.get("/devices")
 def api_devices():
-    policy = load_policy()
+    policy = load_policy_cached()
     devices = policy.get("devices", []) or []
     role = (session.get("web_role") or "admin").strip().lower()
     uname = (session.get("web_username") or "").strip()
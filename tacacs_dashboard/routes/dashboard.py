@@ -4,7 +4,7 @@ from __future__ import annotations
 from flask import Blueprint, render_template
 
 from tacacs_dashboard.services.log_parser import get_recent_events
-from tacacs_dashboard.services.policy_store import load_policy
+from tacacs_dashboard.services.policy_store import load_policy_cached
 
 bp = Blueprint("dashboard", __name__)
 
@@ -13,7 +13,7 @@ def _build_user_role_map() -> dict[str, str]:
     """
     map username -> role จาก policy.json
     """
-    policy = load_policy()
+    policy = load_policy_cached()
     m: dict[str, str] = {}
     for u in (policy.get("users") or []):
         name = (u.get("username") or "").strip()
@@ -4,7 +4,7 @@ from typing import Dict, List
 
 from flask import Blueprint, flash, redirect, render_template, request, session, url_for
 
-from ..services.policy_store import load_policy
+from ..services.policy_store import load_policy_cached
 from ..services.web_users_store import ROLE_SUPERADMIN
 from ..services.device_groups_store import delete_device_group, list_device_groups, upsert_device_group
 
@@ -21,7 +21,7 @@ def index():
         flash("หน้านี้สำหรับผู้ดูแลระบบ (superadmin) เท่านั้น", "error")
         return redirect(url_for("dashboard.index"))
 
-    policy = load_policy()
+    policy = load_policy_cached()
     devices = policy.get("devices", []) or []
     groups = list_device_groups()
 
@@ -1,10 +1,13 @@
 import re
-import subprocess
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 
 from tacacs_dashboard.services.policy_store import load_policy, save_policy
 from tacacs_dashboard.services.tacacs_config import _read_env
-from tacacs_dashboard.services.tacacs_apply import generate_config_file, check_config_syntax
+from tacacs_dashboard.services.tacacs_apply import (
+    generate_config_file,
+    mark_config_applied,
+    restart_tacacs_daemon,
+)
 from tacacs_dashboard.services.olt_bootstrap import bootstrap_device_on_olt
 from tacacs_dashboard.services.access_control import allowed_device_group_ids, device_in_scope
 from tacacs_dashboard.services.device_groups_store import list_device_groups, get_group_name_map, group_exists
@@ -40,18 +43,7 @@ def _restart_tac_plus_ng() -> tuple[bool, str]:
     Requires sudoers to allow the web user to run systemctl restart without
     password.
     """
-    try:
-        r = subprocess.run(
-            ["/usr/bin/sudo", "/bin/systemctl", "restart", "tac_plus-ng"],
-            capture_output=True,
-            text=True,
-            timeout=15,
-        )
-        ok = (r.returncode == 0)
-        msg = (r.stdout or r.stderr or "").strip() or "(no output)"
-        return ok, msg
-    except Exception as e:
-        return False, str(e)
+    return restart_tacacs_daemon()
 
 
 def _run_generate_check_restart_and_flash() -> bool:
@@ -60,8 +52,14 @@ def _run_generate_check_restart_and_flash() -> bool:
     Used from Devices/OLT page so that after adding a new device, operator can
     explicitly apply config before bootstrapping.
     """
-    path, line_count = generate_config_file()
-    ok, message = check_config_syntax(path)
+    path, line_count, changed, ok, message = generate_config_file()
+    if not changed:
+        flash(
+            f"Config ไม่มีการเปลี่ยนแปลง: {path} ({line_count} lines) จึงข้าม syntax check และ restart tac_plus-ng",
+            "info",
+        )
+        return True
+
     short_msg = message if len(message) <= 400 else message[:400] + " ... (truncated)"
 
     if not ok:
@@ -79,6 +77,7 @@ def _run_generate_check_restart_and_flash() -> bool:
     rok, rmsg = _restart_tac_plus_ng()
     rmsg_short = rmsg if len(rmsg) <= 400 else rmsg[:400] + " ... (truncated)"
     if rok:
+        mark_config_applied(path)
         flash(f"Restart tac_plus-ng สำเร็จ: {rmsg_short}", "success")
         return True
 
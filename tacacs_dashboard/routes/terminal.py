@@ -3,14 +3,14 @@ from __future__ import annotations
 
 from flask import Blueprint, render_template, request, jsonify
 
-from ..services.policy_store import load_policy
+from ..services.policy_store import load_policy_cached
 from ..services.web_terminal import create_session, send_line, close_session
 
 bp = Blueprint("terminal", __name__)
 
 @bp.get("/terminal")
 def terminal_page():
-    policy = load_policy()
+    policy = load_policy_cached()
     devices = policy.get("devices", [])
     return render_template("terminal.html", devices=devices, active_page="terminal")
 
@@ -0,0 +1,23 @@
+# tacacs_dashboard/services/_cli_patterns.py
+"""ZTE CLI patterns shared by services/web_terminal.py and tools/oltcli.py.
+
+The compiled *_RE are str patterns (text-mode pexpect, tools/oltcli.py).
+The *_PAT sources are kept so callers can build combined alternations
+(e.g. one regex per login stage) or bytes versions (web_terminal.py)
+without re-typing the patterns.
+"""
+from __future__ import annotations
+
+import re
+
+# ZTE prompt: '>' (user exec) / '#' (privileged exec)
+PROMPT_PAT = r"[>#]\s*$"
+PASS_PAT = r"(?i:password:)"
+LOGIN_PAT = r"(?i:username:|login:)"
+DENIED_PAT = r"(?i:denied|failed|not authorized|invalid|incorrect|authentication failed|login incorrect)"
+
+PROMPT_RE = re.compile(PROMPT_PAT, re.M)
+PASS_RE = re.compile(PASS_PAT)
+LOGIN_RE = re.compile(LOGIN_PAT)
+DENIED_RE = re.compile(DENIED_PAT)
+MORE_RE = re.compile(r"--More--")
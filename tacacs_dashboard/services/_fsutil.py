@@ -0,0 +1,15 @@
+# tacacs_dashboard/services/_fsutil.py
+"""File-system helpers shared by the *_store.py writers and tacacs_apply.py."""
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+
+def fsync_dir(path: Path) -> None:
+    """fsync directory `path` so a rename/link inside it survives a crash."""
+    dir_fd = os.open(path, os.O_DIRECTORY | os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
@@ -26,7 +26,7 @@ Environment overrides (secret.env):
 
 from typing import List, Optional
 
-from .tacacs_config import _read_env
+from .user_secrets_store import _load_env
 from .olt_telnet import telnet_exec_commands
 
 
@@ -119,35 +119,34 @@ def bootstrap_device_on_olt(
     if not ip:
         raise ValueError("ip is required")
 
-    admin_user = (_read_env("OLT_ADMIN_USER", "zte") or "zte").strip()
-    admin_pass = (_read_env("OLT_ADMIN_PASSWORD", "") or "").strip()
+    env = _load_env()  # one cached snapshot of secret.env for every setting below
+
+    admin_user = (env.get("OLT_ADMIN_USER", "zte") or "zte").strip()
+    admin_pass = (env.get("OLT_ADMIN_PASSWORD", "") or "").strip()
     if not admin_pass:
         raise RuntimeError("OLT_ADMIN_PASSWORD not set in secret.env")
 
     # enable password can be empty (some devices use same as login or don't ask)
-    enable_pw = (_read_env("OLT_ENABLE15_PASSWORD", "") or "").strip()
-    if not enable_pw:
-        enable_pw = (_read_env("TACACS_ENABLE_PASSWORD", "") or "").strip()
-    enable_pw = enable_pw or None
+    enable_pw = env.get("OLT_ENABLE15_PASSWORD") or env.get("TACACS_ENABLE_PASSWORD") or None
 
     if timeout is None:
         try:
-            timeout = int((_read_env("OLT_TELNET_TIMEOUT", "8") or "8").strip())
+            timeout = int((env.get("OLT_TELNET_TIMEOUT", "8") or "8").strip())
         except Exception:
             timeout = 8
 
     # Allow overriding group/template IDs from env (optional)
-    g = (_read_env("OLT_TACACS_GROUP", AAA_GROUP_NAME_DEFAULT) or AAA_GROUP_NAME_DEFAULT).strip()
+    g = (env.get("OLT_TACACS_GROUP", AAA_GROUP_NAME_DEFAULT) or AAA_GROUP_NAME_DEFAULT).strip()
     try:
-        aaa_id = int((_read_env("OLT_AAA_TEMPLATE_ID", str(AAA_TEMPLATE_ID_DEFAULT)) or str(AAA_TEMPLATE_ID_DEFAULT)).strip())
+        aaa_id = int((env.get("OLT_AAA_TEMPLATE_ID", str(AAA_TEMPLATE_ID_DEFAULT)) or str(AAA_TEMPLATE_ID_DEFAULT)).strip())
     except Exception:
         aaa_id = AAA_TEMPLATE_ID_DEFAULT
     try:
-        sys_id = int((_read_env("OLT_SYSTEM_USER_TEMPLATE_ID", str(SYSTEM_USER_TEMPLATE_ID_DEFAULT)) or str(SYSTEM_USER_TEMPLATE_ID_DEFAULT)).strip())
+        sys_id = int((env.get("OLT_SYSTEM_USER_TEMPLATE_ID", str(SYSTEM_USER_TEMPLATE_ID_DEFAULT)) or str(SYSTEM_USER_TEMPLATE_ID_DEFAULT)).strip())
     except Exception:
         sys_id = SYSTEM_USER_TEMPLATE_ID_DEFAULT
 
-    exit_style = (_read_env("OLT_CLI_EXIT_STYLE", "exit") or "exit").strip() or "exit"
+    exit_style = (env.get("OLT_CLI_EXIT_STYLE", "exit") or "exit").strip() or "exit"
 
     cmds = build_bootstrap_commands(
         aaa_group_name=g,
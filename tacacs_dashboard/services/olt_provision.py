@@ -1,10 +1,22 @@
 # tacacs_dashboard/services/olt_provision.py
 from __future__ import annotations
 
-from .tacacs_config import _read_env
+from .user_secrets_store import _load_env
 from .olt_telnet import telnet_exec_commands
 from .policy_store import is_reserved_olt_username
 
+
+def _admin_settings() -> tuple[str, str, str, int]:
+    """(admin_user, admin_pass, enable15, timeout_s) from one cached snapshot of secret.env."""
+    env = _load_env()
+    return (
+        env.get("OLT_ADMIN_USER", "zte"),
+        env.get("OLT_ADMIN_PASSWORD", ""),
+        env.get("OLT_ENABLE15_PASSWORD", ""),
+        int(env.get("OLT_TELNET_TIMEOUT", "8") or "8"),
+    )
+
+
 def build_provision_commands(username: str, role: str) -> list[str]:
     cmds: list[str] = [
         "conf t",
@@ -27,10 +39,7 @@ def provision_user_on_olt(
     save: bool = False,
     dry_run: bool = False,
 ) -> str:
-    admin_user = _read_env("OLT_ADMIN_USER", "zte")
-    admin_pass = _read_env("OLT_ADMIN_PASSWORD", "")
-    enable15 = _read_env("OLT_ENABLE15_PASSWORD", "")
-    timeout_s = int(_read_env("OLT_TELNET_TIMEOUT", "8") or "8")
+    admin_user, admin_pass, enable15, timeout_s = _admin_settings()
 
     if not admin_pass:
         raise RuntimeError("OLT_ADMIN_PASSWORD not set in secret.env")
@@ -75,10 +84,7 @@ def deprovision_user_on_olt(
     save: bool = False,
     dry_run: bool = False,
 ) -> str:
-    admin_user = _read_env("OLT_ADMIN_USER", "zte")
-    admin_pass = _read_env("OLT_ADMIN_PASSWORD", "")
-    enable15 = _read_env("OLT_ENABLE15_PASSWORD", "")
-    timeout_s = int(_read_env("OLT_TELNET_TIMEOUT", "8") or "8")
+    admin_user, admin_pass, enable15, timeout_s = _admin_settings()
 
     if not admin_pass:
         raise RuntimeError("OLT_ADMIN_PASSWORD not set in secret.env")
@@ -18,6 +18,9 @@ NOTE: Web Terminal has its own in-memory session implementation.
 This module is for one-shot "connect -> run -> disconnect" jobs.
 """
 
+import functools
+import io
+import os
 import re
 import shutil
 import time
@@ -28,72 +31,84 @@ import pexpect
 
 
 # --- Prompt / message patterns (ZTE typical) ---
-PROMPT_RE = re.compile(r"[>#]\s*$", re.M)  # user exec '>' / privileged '#'
-LOGIN_RE = re.compile(r"(?i)(username:|login:)")
-PASS_RE = re.compile(r"(?i)password:")
-LOGIN_FAIL_RE = re.compile(r"(?i)(login incorrect|bad password|authentication failed)")
-DENIED_RE = re.compile(r"(?i)(denied|not authorized|invalid|incorrect|failed)")
-MORE_RE = re.compile(r"--More--")
+# The child runs in bytes mode (no per-chunk decoding), so patterns are bytes too.
+PROMPT_RE = re.compile(rb"[>#]\s*$", re.M)  # user exec '>' / privileged '#'
+LOGIN_RE = re.compile(rb"(?i)(username:|login:)")
+PASS_RE = re.compile(rb"(?i)password:")
+LOGIN_FAIL_RE = re.compile(rb"(?i)(login incorrect|bad password|authentication failed)")
+DENIED_RE = re.compile(rb"(?i)(denied|not authorized|invalid|incorrect|failed)")
+# DENIED_RE's alternatives as literals, for checks on our side (pexpect still gets DENIED_RE)
+_DENIED_TOKENS = (b"denied", b"not authorized", b"invalid", b"incorrect", b"failed")
+MORE_RE = re.compile(rb"--More--")
+_BS_COLLAPSE_RE = re.compile(r"[^\x08]\x08")  # str pattern: runs after decode
 
 # map role -> enable level
 ROLE_TO_ENABLE = {"OLT_VIEW": 1, "OLT_ENGINEER": 7, "OLT_ADMIN": 15}
+_ROLE_TO_ENABLE_NORMALIZED = {k.upper(): v for k, v in ROLE_TO_ENABLE.items()}
 
-# ANSI / cursor-control cleanup (helps for help output like: `pon ?`)
-_ANSI_RE = re.compile(r"\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])")
-_CSI_MOVE_RE = re.compile(r"\x1B\[[0-9;]*[A-Za-z]")
+# ANSI / cursor-control cleanup (helps for help output like: `pon ?`) fused with
+# the blank-line collapse: group 1 = escape sequence (drop), group 2 = 4+ newlines.
+# (The old cursor-move pattern \x1B\[[0-9;]*[A-Za-z] is a subset of group 1.)
+_CLEAN_RE = re.compile(rb"(\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~]))|(\n{4,})")
 
 
-def _strip_ansi(s: str) -> str:
-    if not s:
-        return ""
-    s = s.replace("\r\n", "\n").replace("\r", "\n")
-    s = _ANSI_RE.sub("", s)
-    s = _CSI_MOVE_RE.sub("", s)
-    return s
+def _clean_sub(m: re.Match) -> bytes:
+    return b"" if m.group(1) else b"\n\n\n"
+
+
+def _is_denied(chunk: bytes) -> bool:
+    """Same answer as DENIED_RE.search(chunk), via substring checks instead of the regex engine."""
+    low = chunk.lower()
+    return any(tok in low for tok in _DENIED_TOKENS)
 
 
 def _normalize_backspaces(s: str) -> str:
-    if not s:
-        return ""
-    buf: list[str] = []
-    for ch in s:
-        if ch == "\b":
-            if buf:
-                buf.pop()
-        else:
-            buf.append(ch)
-    return "".join(buf)
+    # common case: nothing to do
+    if not s or "\b" not in s:
+        return s or ""
+    # each pass erases "<char><BS>" pairs; repeat for runs like "abc\b\b\b"
+    while True:
+        collapsed = _BS_COLLAPSE_RE.sub("", s)
+        if collapsed == s:
+            break
+        s = collapsed
+    # whatever is left are backspaces with nothing before them
+    return s.replace("\b", "")
 
 
-def _clean_output(s: str) -> str:
-    s = _strip_ansi(s)
-    s = _normalize_backspaces(s)
-    # reduce excessive blank lines
-    s = re.sub(r"\n{4,}", "\n\n\n", s)
-    return s
+def _clean_output(raw: bytes) -> str:
+    """Strip terminal noise from raw child output and decode it (once)."""
+    if not raw:
+        return ""
+    b = raw.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+    # one pass: drop escape sequences + reduce excessive blank lines
+    b = _CLEAN_RE.sub(_clean_sub, b)
+    return _normalize_backspaces(b.decode("utf-8", errors="replace"))
 
 
-def _cap(child: pexpect.spawn) -> str:
+def _cap(child: pexpect.spawn) -> bytes:
     """Capture child.before + child.after safely."""
-    before = child.before or ""
-    after = child.after if isinstance(child.after, str) else ""
+    before = child.before or b""
+    after = child.after if isinstance(child.after, bytes) else b""
     return before + after
 
 
+@functools.lru_cache(maxsize=1)
 def _telnet_bin() -> str:
     # Prefer absolute path (systemd often has limited PATH)
     for p in ("/usr/bin/telnet", "/bin/telnet"):
         try:
-            if shutil.which(p) or (p and __import__("os").path.exists(p)):
+            if shutil.which(p) or (p and os.path.exists(p)):
                 return p
         except Exception:
             pass
     return shutil.which("telnet") or "/usr/bin/telnet"
 
 
+@functools.lru_cache(maxsize=64)
 def _resolve_enable_level(role: Optional[str], enable_level: Optional[int]) -> int:
     if role:
-        return int(ROLE_TO_ENABLE.get(role.strip().upper(), 15))
+        return int(_ROLE_TO_ENABLE_NORMALIZED.get(role.strip().upper(), 15))
     if enable_level is not None:
         return int(enable_level)
     return 15
@@ -108,7 +123,7 @@ class TelnetCommandResult:
 def _expect_one(
     child: pexpect.spawn,
     patterns: list[Any],
-    out_chunks: list[str],
+    out_chunks: list[bytes],
     *,
     timeout: int,
 ) -> int:
@@ -123,7 +138,7 @@ def _login(
     username: str,
     password: str,
     timeout: int,
-    out_chunks: list[str],
+    out_chunks: list[bytes],
 ) -> None:
     """Login and stop at a prompt."""
     username = (username or "").strip()
@@ -150,7 +165,7 @@ def _login(
     if idx == 0:
         child.sendline(username)
         _expect_one(child, [PASS_RE, DENIED_RE, pexpect.TIMEOUT, pexpect.EOF], out_chunks, timeout=timeout)
-        if DENIED_RE.search(out_chunks[-1]) if out_chunks else False:
+        if out_chunks and _is_denied(out_chunks[-1]):
             raise RuntimeError("Login denied after sending username.")
 
     child.sendline(password)
@@ -176,11 +191,11 @@ def _auto_enable(
     login_password: str,
     enable_password: Optional[str],
     timeout: int,
-    out_chunks: list[str],
+    out_chunks: list[bytes],
 ) -> None:
     """If currently at '>' prompt, send `enable <level>` and answer password if asked."""
-    prompt = (child.after or "") if isinstance(child.after, str) else ""
-    if not prompt.strip().endswith(">"):
+    prompt = child.after if isinstance(child.after, bytes) else b""
+    if not prompt.strip().endswith(b">"):
         return
 
     child.sendline(f"enable {int(level)}")
@@ -215,11 +230,12 @@ def _run_one_command(
     *,
     cmd: str,
     timeout: int,
-    out_chunks: list[str],
-) -> str:
+    out_chunks: list[bytes],
+    slow_cli: bool = False,
+) -> bytes:
     """Send one command and read until prompt. Returns raw output for this command."""
     child.sendline(cmd)
-    buf: list[str] = []
+    buf: list[bytes] = []
 
     while True:
         idx = child.expect([MORE_RE, PROMPT_RE, DENIED_RE, LOGIN_FAIL_RE, pexpect.TIMEOUT, pexpect.EOF], timeout=timeout)
@@ -229,7 +245,8 @@ def _run_one_command(
 
         if idx == 0:
             child.send(" ")
-            time.sleep(0.05)
+            if slow_cli:
+                time.sleep(0.05)
             continue
         if idx == 1:
             break
@@ -239,7 +256,68 @@ def _run_one_command(
             raise TimeoutError(f"Timeout waiting for prompt after command: {cmd}")
         break
 
-    return "".join(buf)
+    return b"".join(buf)
+
+
+def _expect_n_prompts(
+    child: pexpect.spawn,
+    *,
+    cmds: list[str],
+    timeout: int,
+    out_chunks: list[bytes],
+    slow_cli: bool = False,
+) -> list[bytes]:
+    """Read the output of `cmds` that were already sent back-to-back.
+
+    One prompt is expected per command; the stream is split at each prompt,
+    so item i is the raw output of cmds[i]. Type-ahead is echoed right after
+    the prompt ("OLT#show ..."), so every prompt but the last is matched as
+    "prompt followed by the next command's echo" instead of PROMPT_RE.
+    Errors are raised for the command whose output was being read, exactly
+    like `_run_one_command`.
+    """
+    prompt_res = [
+        re.compile(rb"[>#][ \t]*(?=" + re.escape(nxt.encode("utf-8")) + rb")")
+        for nxt in cmds[1:]
+    ]
+    prompt_res.append(PROMPT_RE)
+
+    deadline = time.monotonic() + timeout * len(cmds)
+    results: list[bytes] = []
+    buf: list[bytes] = []
+
+    while len(results) < len(cmds):
+        cmd = cmds[len(results)]
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Timeout waiting for prompt after command: {cmd}")
+
+        idx = child.expect(
+            [MORE_RE, prompt_res[len(results)], DENIED_RE, LOGIN_FAIL_RE, pexpect.TIMEOUT, pexpect.EOF],
+            timeout=remaining,
+        )
+        piece = _cap(child)
+        out_chunks.append(piece)
+        buf.append(piece)
+
+        if idx == 0:
+            child.send(" ")
+            if slow_cli:
+                time.sleep(0.05)
+            continue
+        if idx == 1:
+            results.append(b"".join(buf))
+            buf = []
+            continue
+        if idx in (2, 3):
+            raise RuntimeError(f"Command denied/failed: {cmd}")
+        if idx == 4:
+            raise TimeoutError(f"Timeout waiting for prompt after command: {cmd}")
+        # EOF: keep what we got for the current command and stop
+        results.append(b"".join(buf))
+        break
+
+    return results
 
 
 def telnet_exec_commands(
@@ -261,8 +339,19 @@ def telnet_exec_commands(
     # output behavior
     debug: bool = False,
     max_output_chars: int = 12000,
+    pipeline: int = 1,
+    slow_cli: bool = False,
 ) -> str:
-    """Connect via telnet, login, (optionally) enable, run commands, disconnect."""
+    """Connect via telnet, login, (optionally) enable, run commands, disconnect.
+
+    pipeline > 1 sends that many commands back-to-back before reading, then
+    splits the output on the returned prompts (one RTT per batch instead of
+    per command). Only use it for CLIs that buffer type-ahead input and for
+    commands that do not page (a `--More--` pager would eat the type-ahead).
+
+    slow_cli=True pauses briefly after answering `--More--`, for devices that
+    drop input sent right after the pager prompt.
+    """
     host = (host or "").strip()
     if not host:
         raise ValueError("host is required")
@@ -277,10 +366,10 @@ def telnet_exec_commands(
         pw = ""
 
     telnet_bin = _telnet_bin()
-    child = pexpect.spawn(telnet_bin, [host], encoding="utf-8", timeout=timeout)
+    child = pexpect.spawn(telnet_bin, [host], timeout=timeout)
     child.delaybeforesend = 0.05
 
-    out_chunks: list[str] = []
+    out_chunks: list[bytes] = []
     per_cmd: list[TelnetCommandResult] = []
 
     try:
@@ -297,13 +386,30 @@ def telnet_exec_commands(
                 out_chunks=out_chunks,
             )
 
+        cmds: list[str] = []
         for cmd in commands:
             cmd = "" if cmd is None else str(cmd)
             cmd = cmd.rstrip("\n")
-            if not cmd:
-                continue
-            raw = _run_one_command(child, cmd=cmd, timeout=timeout, out_chunks=out_chunks)
-            per_cmd.append(TelnetCommandResult(cmd=cmd, output=_clean_output(raw)))
+            if cmd:
+                cmds.append(cmd)
+
+        step = max(1, int(pipeline or 1))
+        for i in range(0, len(cmds), step):
+            batch = cmds[i : i + step]
+            if len(batch) == 1:
+                raws = [
+                    _run_one_command(
+                        child, cmd=batch[0], timeout=timeout, out_chunks=out_chunks, slow_cli=slow_cli
+                    )
+                ]
+            else:
+                for cmd in batch:
+                    child.sendline(cmd)
+                raws = _expect_n_prompts(
+                    child, cmds=batch, timeout=timeout, out_chunks=out_chunks, slow_cli=slow_cli
+                )
+            for cmd, raw in zip(batch, raws):
+                per_cmd.append(TelnetCommandResult(cmd=cmd, output=_clean_output(raw)))
 
         try:
             child.sendline("exit")
@@ -317,24 +423,37 @@ def telnet_exec_commands(
         except Exception:
             pass
 
-    lines: list[str] = []
-    banner = _clean_output("".join(out_chunks))
-    if banner.strip() and debug:
-        lines.append("=== CONNECT/LOGIN (raw-ish) ===")
-        lines.append(banner.strip())
+    # Stream the report and stop as soon as it is past max_output_chars,
+    # instead of joining everything and slicing most of it away.
+    limit = int(max_output_chars or 0)
+    sio = io.StringIO()
 
-    lines.append(f"=== OLT TELNET JOB: {host} ===")
+    def emit(x: str) -> bool:
+        sio.write(x)
+        sio.write("\n")
+        # length as the final text measures it: without this "\n" and the trailing
+        # whitespace strip() would drop if x turned out to be the last line
+        return bool(limit) and sio.tell() - 1 - (len(x) - len(x.rstrip())) > limit
+
+    full = False
+    if debug:
+        banner = _clean_output(b"".join(out_chunks)).strip()
+        if banner:
+            full = emit("=== CONNECT/LOGIN (raw-ish) ===") or emit(banner)
+
+    if not full:
+        full = emit(f"=== OLT TELNET JOB: {host} ===")
 
     for item in per_cmd:
-        lines.append("")
-        lines.append(f"$ {item.cmd}")
+        if full:
+            break
         out = (item.output or "").strip()
-        if out:
-            lines.append(out)
+        full = emit("") or emit(f"$ {item.cmd}") or (bool(out) and emit(out))
 
-    text = "\n".join(lines).strip() + "\n"
-    if max_output_chars and len(text) > int(max_output_chars):
-        text = text[: int(max_output_chars)] + "\n... (truncated)\n"
+    text = sio.getvalue()
+    if not full:
+        text = text.strip() + "\n"
+    if limit and len(text) > limit:
+        text = text[:limit] + "\n... (truncated)\n"
 
     return text
-
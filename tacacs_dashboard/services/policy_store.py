@@ -2,8 +2,18 @@
 from __future__ import annotations
 from pathlib import Path
 import json
+import os
+import threading
 from typing import Any, Dict, List, Optional
 
+from ._fsutil import fsync_dir
+from .privilege import parse_privilege
+
+try:  # optional C decoder for reloads; stdlib json is the fallback
+    import orjson
+except ImportError:
+    orjson = None
+
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 POLICY_PATH = BASE_DIR / "policy.json"
 
@@ -16,18 +26,32 @@ def is_reserved_olt_username(username: str) -> bool:
 
 
 
-def load_policy() -> Dict[str, Any]:
-    # กันกรณีไฟล์ยังไม่ถูกสร้าง
-    if not POLICY_PATH.exists():
-        return {"users": [], "roles": [], "devices": [], "device_groups": []}
+# Last read of policy.json, keyed on (st_mtime_ns, st_size).
+# - raw:   file text; load_policy() parses it again so callers get a dict they may mutate
+# - data:  parsed policy, shared -> treat as read-only
+# - index: stripped username -> position in data["users"] (first match wins)
+# - devices_by_name / users_by_lower / roles_by_upper / send_delay_by_device: see _build_lookups()
+_CACHE: Dict[str, Any] = {
+    "key": None,
+    "raw": "",
+    "data": None,
+    "index": {},
+    "devices_by_name": {},
+    "users_by_lower": {},
+    "roles_by_upper": {},
+    "send_delay_by_device": {},
+}
+_CACHE_LOCK = threading.Lock()
+
 
-    raw = POLICY_PATH.read_text(encoding="utf-8").strip()
+def _parse_policy(raw: str) -> Dict[str, Any]:
+    raw = raw.strip()
     if not raw:
         return {"users": [], "roles": [], "devices": [], "device_groups": []}
 
     try:
-        data = json.loads(raw)
-    except json.JSONDecodeError:
+        data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    except json.JSONDecodeError:  # orjson.JSONDecodeError is a subclass
         # ถ้าไฟล์พัง ให้ fallback (หรือจะ raise ก็ได้)
         return {"users": [], "roles": [], "devices": [], "device_groups": []}
 
@@ -39,10 +63,142 @@ def load_policy() -> Dict[str, Any]:
     return data
 
 
+def _build_user_index(data: Dict[str, Any]) -> Dict[str, int]:
+    index: Dict[str, int] = {}
+    for i, u in enumerate(data.get("users") or []):
+        index.setdefault((u.get("username") or "").strip(), i)
+    return index
+
+
+def _build_lookups(data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Normalized lookup dicts (first match wins, like the linear scans they replace).
+
+    - devices_by_name: device name -> ip/address (devices without an address are skipped)
+    - users_by_lower:  username.lower() -> role
+    - roles_by_upper:  role name.upper() -> privilege (parsed, clamped 1..15)
+    - send_delay_by_device: device name and ip -> optional per-device "send_delay"
+      (seconds, > 0) for firmware that drops bytes typed too quickly
+    """
+    devices_by_name: Dict[str, str] = {}
+    send_delay_by_device: Dict[str, float] = {}
+    for d in data.get("devices") or []:
+        name = (d.get("name") or "").strip()
+        ip = (d.get("ip") or d.get("address") or "").strip()
+        if ip:
+            devices_by_name.setdefault(name, ip)
+        try:
+            delay = float(d.get("send_delay") or 0)
+        except (TypeError, ValueError):
+            delay = 0.0
+        if delay > 0:
+            for k in (name, ip):
+                if k:
+                    send_delay_by_device.setdefault(k, delay)
+
+    users_by_lower: Dict[str, str] = {}
+    for u in data.get("users") or []:
+        role = (u.get("roles") or u.get("role") or "").strip()
+        users_by_lower.setdefault((u.get("username") or "").strip().lower(), role)
+
+    roles_by_upper: Dict[str, int] = {}
+    for r in data.get("roles") or []:
+        priv = parse_privilege(r.get("privilege"), default=1)
+        roles_by_upper.setdefault((r.get("name") or "").strip().upper(), priv)
+
+    return {
+        "devices_by_name": devices_by_name,
+        "users_by_lower": users_by_lower,
+        "roles_by_upper": roles_by_upper,
+        "send_delay_by_device": send_delay_by_device,
+    }
+
+
+def _cache_entry() -> Dict[str, Any]:
+    """Return a consistent snapshot of the cache, re-reading policy.json if it changed."""
+    try:
+        st = POLICY_PATH.stat()
+    except FileNotFoundError:
+        # กันกรณีไฟล์ยังไม่ถูกสร้าง
+        data = _parse_policy("")
+        return {"key": None, "raw": "", "data": data, "index": {}, **_build_lookups(data)}
+
+    key = (st.st_mtime_ns, st.st_size)
+    with _CACHE_LOCK:
+        if _CACHE["key"] != key:
+            raw = POLICY_PATH.read_text(encoding="utf-8")
+            data = _parse_policy(raw)
+            _CACHE.update(key=key, raw=raw, data=data, index=_build_user_index(data), **_build_lookups(data))
+        return dict(_CACHE)
+
+
+def load_policy() -> Dict[str, Any]:
+    """Return policy.json as a fresh dict (safe to mutate and pass to save_policy)."""
+    return _parse_policy(_cache_entry()["raw"])
+
+
+def load_policy_cached() -> Dict[str, Any]:
+    """Return the cached parsed policy without copying.
+
+    The dict is shared by every caller until policy.json changes: read it, never
+    mutate it. Use load_policy() when you intend to modify and save.
+    """
+    return _cache_entry()["data"]
+
+
+def policy_snapshot() -> Dict[str, Any]:
+    """One consistent view of the cached policy + lookup dicts (read-only).
+
+    Pass it as `snapshot=` to the get_* helpers below to resolve several
+    things against the same policy.json with a single stat.
+    """
+    return _cache_entry()
+
+
+def get_device_ip(name: str, snapshot: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """IP/address of the device called `name` (None if unknown or without address)."""
+    return (snapshot or _cache_entry())["devices_by_name"].get((name or "").strip())
+
+
+def get_user_role(username: str, snapshot: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """Role of a TACACS user, matched case-insensitively (None if unknown)."""
+    return (snapshot or _cache_entry())["users_by_lower"].get((username or "").strip().lower())
+
+
+def get_role_priv(role: str, snapshot: Optional[Dict[str, Any]] = None) -> Optional[int]:
+    """Parsed privilege of a role, matched case-insensitively (None if unknown)."""
+    return (snapshot or _cache_entry())["roles_by_upper"].get((role or "").strip().upper())
+
+
+def get_device_send_delay(name_or_ip: str, snapshot: Optional[Dict[str, Any]] = None) -> Optional[float]:
+    """Per-device delay before each send (devices[].send_delay), None = no delay."""
+    return (snapshot or _cache_entry())["send_delay_by_device"].get((name_or_ip or "").strip())
+
+
+def _load_policy_indexed() -> tuple[Dict[str, Any], Dict[str, int]]:
+    """Fresh policy plus the username index that matches it."""
+    entry = _cache_entry()
+    return _parse_policy(entry["raw"]), entry["index"]
+
+
 def save_policy(policy: Dict[str, Any]) -> None:
+    """Write policy.json atomically and durably.
+
+    Stream-encode into a tmp file, fsync it, rename over policy.json,
+    then fsync the directory so the rename itself survives a crash.
+    """
     tmp = POLICY_PATH.with_suffix(".tmp")
-    tmp.write_text(json.dumps(policy, ensure_ascii=False, indent=2), encoding="utf-8")
-    tmp.replace(POLICY_PATH)
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    # always stdlib json here: orjson formats floats differently (1e-07 vs 1e-7)
+    # and rejects non-str keys / >64-bit ints, so only the read side uses it
+    with os.fdopen(fd, "w", encoding="utf-8") as fp:
+        json.dump(policy, fp, ensure_ascii=False, indent=2)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(tmp, POLICY_PATH)
+    with _CACHE_LOCK:
+        _CACHE["key"] = None
+
+    fsync_dir(POLICY_PATH.parent)
 
 
 def upsert_user(
@@ -61,7 +217,7 @@ def upsert_user(
     role = (role or "OLT_VIEW").strip() or "OLT_VIEW"
     status = (status or "Active").strip() or "Active"
 
-    policy = load_policy()
+    policy, index = _load_policy_indexed()
     users = policy.setdefault("users", [])
 
     # normalize group ids if provided
@@ -76,18 +232,19 @@ def upsert_user(
     # If explicitly provided but empty => treat as 'unscoped' (remove key)
     clear_device_groups = (gids is not None and len(gids) == 0)
 
-    for u in users:
-        if (u.get("username") or "").strip() == username:
-            u["roles"] = role      # ใช้ key 'roles' ตาม policy ของคุณ
-            u["status"] = status
-            u.setdefault("last_login", "-")
-            if gids is not None:
-                if clear_device_groups:
-                    u.pop("device_group_ids", None)
-                else:
-                    u["device_group_ids"] = gids
-            save_policy(policy)
-            return False
+    idx = index.get(username)
+    if idx is not None:
+        u = users[idx]
+        u["roles"] = role      # ใช้ key 'roles' ตาม policy ของคุณ
+        u["status"] = status
+        u.setdefault("last_login", "-")
+        if gids is not None:
+            if clear_device_groups:
+                u.pop("device_group_ids", None)
+            else:
+                u["device_group_ids"] = gids
+        save_policy(policy)
+        return False
 
     rec: Dict[str, Any] = {
         "username": username,
@@ -108,13 +265,12 @@ def delete_user(username: str) -> bool:
     if not username:
         return False
 
-    policy = load_policy()
-    users = policy.get("users", [])
-    before = len(users)
-    policy["users"] = [u for u in users if (u.get("username") or "").strip() != username]
-    if len(policy["users"]) == before:
+    policy, index = _load_policy_indexed()
+    if username not in index:
         return False
 
+    # remove every entry with this stripped name (duplicates like " alice" / "alice" exist)
+    policy["users"] = [u for u in policy.get("users", []) if (u.get("username") or "").strip() != username]
     save_policy(policy)
     return True
 
@@ -3,6 +3,8 @@ from __future__ import annotations
 
 import re
 
+_DIGIT_RE = re.compile(r"\d+")
+
 
 def parse_privilege(value, *, default: int = 1) -> int:
     """Parse a privilege/enable level and clamp to 1..15.
@@ -10,14 +12,18 @@ def parse_privilege(value, *, default: int = 1) -> int:
     The UI/user may input privilege as '15', 15, '15 / full', etc.
     We extract the first integer and clamp to the valid ZTE enable range.
     """
+    # common cases first: a non-negative int (not bool), or a plain ASCII digit string
+    if type(value) is int and value >= 0:
+        return max(1, min(15, value))
+
     if value is None:
         n = int(default)
         return max(1, min(15, n))
 
-    m = re.search(r"\d+", str(value))
-    if not m:
-        n = int(default)
-        return max(1, min(15, n))
+    s = str(value).strip()
+    if s.isascii() and s.isdecimal():
+        return max(1, min(15, int(s)))
 
-    n = int(m.group(0))
+    m = _DIGIT_RE.search(s)
+    n = int(m.group(0)) if m else int(default)
     return max(1, min(15, n))
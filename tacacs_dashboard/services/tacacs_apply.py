@@ -1,47 +1,196 @@
 from __future__ import annotations
 
 from pathlib import Path
+import hashlib
 import subprocess
 import os
+import tempfile
 
+from ._fsutil import fsync_dir
 from .tacacs_config import build_config_text, build_pass_secret_text, PASS_SECRET_PATH
 
 DEFAULT_CONFIG_PATH = Path("/home/trainee25/tacacs-web/tacacs-generated.cfg")
 TACACS_BIN = "/usr/local/sbin/tac_plus-ng"
 TACACS_SERVICE = "tac_plus-ng"
+SUDO_BIN = "/usr/bin/sudo"
+SYSTEMCTL_BIN = "/bin/systemctl"
 
+# where the config is written for `tac_plus-ng -P` before it is installed
+CHECK_TMP_DIR = "/dev/shm"
 
-def generate_config_file(config_path: Path | str = DEFAULT_CONFIG_PATH) -> tuple[str, int]:
-    config_path = Path(config_path)
+# digest of config + pass.secret that passed the check, keyed by config path;
+# written to the .applied sidecar by mark_config_applied() once the restart succeeded
+_PENDING_APPLIED: dict[str, str] = {}
+
+
+def _line_count(text: str) -> int:
+    """Same as len(text.splitlines()) for \n-terminated lines, without building the list."""
+    if not text:
+        return 0
+    return text.count("\n") + (0 if text.endswith("\n") else 1)
+
+
+def _text_digest(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _digest_path(path: Path) -> Path:
+    # sidecar next to the generated file, e.g. tacacs-generated.cfg.sha
+    return path.with_name(path.name + ".sha")
+
+
+def _applied_path(config_path: Path) -> Path:
+    # digest of the config + pass.secret last applied (checked and restarted)
+    return config_path.with_name(config_path.name + ".applied")
+
+
+def _read_applied(config_path: Path) -> str | None:
+    try:
+        return _applied_path(config_path).read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+
+
+def _is_unchanged(path: Path, digest: str) -> bool:
+    """True if `path` exists and was last written from text with this digest."""
+    if not path.exists():
+        return False
+    try:
+        return _digest_path(path).read_text(encoding="utf-8").strip() == digest
+    except OSError:
+        return False
+
+
+def _write_digest(sha_path: Path, digest: str, mode: int) -> None:
+    sha_path.write_text(digest + "\n", encoding="utf-8")
+    os.chmod(sha_path, mode)
+
+
+def _write_all(fd: int, data: bytes) -> None:
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def _write_synced(path: Path, data: bytes, mode: int) -> None:
+    """Create/truncate `path` with `mode`, write `data` and fsync it."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    try:
+        os.fchmod(fd, mode)  # O_CREAT mode is filtered by umask
+        _write_all(fd, data)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _link_tmpfile(tmp_path: Path, data: bytes, mode: int) -> bool:
+    """
+    Linux: write into an anonymous O_TMPFILE, fsync, then link it as `tmp_path`
+    (a crash mid-write leaves no half-written tmp file behind).
+    False if O_TMPFILE / /proc linking isn't available here.
+    """
+    flag = getattr(os, "O_TMPFILE", None)
+    if flag is None:
+        return False
+    try:
+        fd = os.open(tmp_path.parent, flag | os.O_WRONLY, mode)
+    except OSError:  # EOPNOTSUPP / EISDIR / EINVAL on filesystems without support
+        return False
+    try:
+        os.fchmod(fd, mode)
+        _write_all(fd, data)
+        os.fsync(fd)
+        tmp_path.unlink(missing_ok=True)
+        os.link(f"/proc/self/fd/{fd}", tmp_path, follow_symlinks=True)
+    except OSError:
+        return False
+    finally:
+        os.close(fd)
+    return True
+
+
+def _atomic_write_durable(path: Path, data: bytes, mode: int) -> None:
+    """
+    แทนที่ `path` แบบ atomic และทนไฟดับ:
+    เขียน+fsync ไฟล์ tmp -> rename ทับ -> fsync directory
+    """
+    tmp_path = path.with_suffix(".tmp")
+    if not _link_tmpfile(tmp_path, data, mode):
+        _write_synced(tmp_path, data, mode)
+    os.replace(tmp_path, path)
+    fsync_dir(path.parent)
 
-    # 1) สร้าง pass.secret ก่อน (เพราะ config include)
-    generate_pass_secret_file()
 
-    # 2) สร้าง tacacs-generated.cfg (atomic)
+def _check_tmp_dir() -> str | None:
+    """tmpfs for the throwaway syntax-check copy; None = tempfile's default dir."""
+    return CHECK_TMP_DIR if os.access(CHECK_TMP_DIR, os.W_OK) else None
+
+
+def generate_config_file(
+    config_path: Path | str = DEFAULT_CONFIG_PATH,
+) -> tuple[str, int, bool, bool, str]:
+    """
+    สร้าง pass.secret + tacacs-generated.cfg (ตรวจ syntax ก่อนแทนที่ไฟล์จริง)
+    คืนค่า (path, line_count, changed, ok, message)
+    - ok, message: ผล tac_plus-ng -P ของ config ชุดนี้
+    - changed=False แปลว่า config + pass.secret ตรงกับชุดที่ apply สำเร็จครั้งล่าสุด
+      (ผ่าน syntax check และ restart แล้ว, ดู mark_config_applied) ไม่ต้อง check/restart
+    """
+    config_path = Path(config_path)
+
     text = build_config_text()
-    tmp_path = config_path.with_suffix(".tmp")
-    tmp_path.write_text(text, encoding="utf-8")
-    os.chmod(tmp_path, 0o644)
-    tmp_path.replace(config_path)
+    secret_text = build_pass_secret_text()
+    line_count = _line_count(text)
+    data = text.encode("utf-8")
+    digest = _text_digest(text + "\0" + secret_text)
+    if config_path.exists() and _read_applied(config_path) == digest:
+        return str(config_path), line_count, False, True, ""
 
-    return str(config_path), len(text.splitlines())
+    # 1) เขียน pass.secret ก่อน (config include ไฟล์นี้ -> tac_plus-ng -P ต้องเห็นฉบับใหม่)
+    _write_pass_secret(Path(PASS_SECRET_PATH), secret_text)
 
+    # 2) ตรวจ syntax กับสำเนาชั่วคราวใน tmpfs
+    #    (ไม่ต้อง fsync เพราะใช้ตรวจแล้วทิ้ง; ไฟล์จริงเขียนหลัง syntax ผ่านเท่านั้น)
+    fd, check_path = tempfile.mkstemp(prefix="tacacs-check-", suffix=".cfg", dir=_check_tmp_dir())
+    try:
+        try:
+            _write_all(fd, data)
+        finally:
+            os.close(fd)
+        ok, message = _run_syntax_check(Path(check_path))
+    finally:
+        os.unlink(check_path)
 
-def check_config_syntax(config_path: Path | str = DEFAULT_CONFIG_PATH) -> tuple[bool, str]:
+    # 3) แทนที่ tacacs-generated.cfg (atomic + durable) เฉพาะเมื่อ syntax ผ่าน
+    if ok:
+        _atomic_write_durable(config_path, data, 0o644)
+        # บันทึกว่า apply แล้วหลัง restart สำเร็จเท่านั้น (mark_config_applied)
+        _PENDING_APPLIED[str(config_path)] = digest
+    else:
+        # เก็บไฟล์ที่ตรวจไม่ผ่านไว้ข้าง ๆ ให้เปิดดูได้
+        tmp_path = config_path.with_suffix(".tmp")
+        tmp_path.write_bytes(data)
+        message = f"{message}\n(ยังไม่ได้แทนที่ {config_path}; ไฟล์ที่ตรวจไม่ผ่านอยู่ที่ {tmp_path})"
+
+    return str(config_path), line_count, True, ok, message
+
+
+def mark_config_applied(config_path: Path | str = DEFAULT_CONFIG_PATH) -> None:
     """
-    รัน tac_plus-ng -P เพื่อตรวจ syntax ของไฟล์ config
-    คืนค่า (ok, message)
+    เรียกหลัง restart tac_plus-ng สำเร็จ: จำ digest ของ config + pass.secret ชุดนี้
+    ครั้งต่อไปถ้าไม่มีอะไรเปลี่ยน generate_config_file จะคืน changed=False
     """
     config_path = Path(config_path)
+    digest = _PENDING_APPLIED.pop(str(config_path), None)
+    if digest is not None:
+        _write_digest(_applied_path(config_path), digest, 0o644)
 
-    if not config_path.exists():
-        return False, f"Config file does not exist: {config_path}"
 
+def _run_syntax_check(config_path: Path) -> tuple[bool, str]:
     try:
         result = subprocess.run(
             [TACACS_BIN, "-P", str(config_path)],
             capture_output=True,
-            text=True,
             timeout=10,
         )
     except FileNotFoundError:
@@ -49,8 +198,9 @@ def check_config_syntax(config_path: Path | str = DEFAULT_CONFIG_PATH) -> tuple[
     except subprocess.TimeoutExpired:
         return False, "คำสั่ง tac_plus-ng -P timeout"
 
-    out = (result.stdout or "").strip()
-    err = (result.stderr or "").strip()
+    # bytes from the pipe, decoded once here (no TextIOWrapper in between)
+    out = (result.stdout or b"").decode("utf-8", "replace").strip()
+    err = (result.stderr or b"").decode("utf-8", "replace").strip()
     message = out if out else err
     if not message:
         message = "(no output)"
@@ -59,18 +209,36 @@ def check_config_syntax(config_path: Path | str = DEFAULT_CONFIG_PATH) -> tuple[
     return ok, message
 
 
-def generate_pass_secret_file(pass_path: Path | str = PASS_SECRET_PATH) -> tuple[str, int]:
-    pass_path = Path(pass_path)
-    pass_path.parent.mkdir(parents=True, exist_ok=True)
+def check_config_syntax(config_path: Path | str = DEFAULT_CONFIG_PATH) -> tuple[bool, str]:
+    """
+    รัน tac_plus-ng -P เพื่อตรวจ syntax ของไฟล์ config
+    คืนค่า (ok, message)
+    """
+    config_path = Path(config_path)
 
+    if not config_path.exists():
+        return False, f"Config file does not exist: {config_path}"
+
+    return _run_syntax_check(config_path)
+
+
+def generate_pass_secret_file(pass_path: Path | str = PASS_SECRET_PATH) -> tuple[str, int, bool]:
+    pass_path = Path(pass_path)
     text = build_pass_secret_text()
+    changed = _write_pass_secret(pass_path, text)
+    return str(pass_path), _line_count(text), changed
 
-    tmp_path = pass_path.with_suffix(".tmp")
-    tmp_path.write_text(text, encoding="utf-8")
-    os.chmod(tmp_path, 0o600)
-    tmp_path.replace(pass_path)
 
-    return str(pass_path), len(text.splitlines())
+def _write_pass_secret(pass_path: Path, text: str) -> bool:
+    """Install pass.secret unless the file already holds `text`; True if it was written."""
+    digest = _text_digest(text)
+    if _is_unchanged(pass_path, digest):
+        return False
+
+    pass_path.parent.mkdir(parents=True, exist_ok=True)
+    _atomic_write_durable(pass_path, text.encode("utf-8"), 0o600)
+    _write_digest(_digest_path(pass_path), digest, 0o600)
+    return True
 
 
 def restart_tacacs_daemon() -> tuple[bool, str]:
@@ -80,7 +248,7 @@ def restart_tacacs_daemon() -> tuple[bool, str]:
     """
     try:
         r = subprocess.run(
-            ["sudo", "systemctl", "restart", TACACS_SERVICE],
+            [SUDO_BIN, SYSTEMCTL_BIN, "restart", TACACS_SERVICE],
             capture_output=True,
             text=True,
             timeout=15,
@@ -4,28 +4,22 @@ from __future__ import annotations
 from pathlib import Path
 import re
 
-from .policy_store import load_policy
-from .user_secrets_store import get_user_password, ensure_user_has_password
+from .policy_store import load_policy_cached
+from .user_secrets_store import (
+    _read_env,
+    ensure_user_has_password,
+    get_user_password,
+    secrets_transaction,
+)
 from .privilege import parse_privilege
 
 # โฟลเดอร์ฐานของโปรเจกต์ (ที่มี policy.json, secret.env, pass.secret)
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
-SECRET_ENV_PATH = BASE_DIR / "secret.env"
 PASS_SECRET_PATH = BASE_DIR / "pass.secret"
 
 LOG_DIR = Path("/var/log/tac_plus")
 
-
-def _read_env(key: str, default: str = "") -> str:
-    if not SECRET_ENV_PATH.exists():
-        return default
-    for line in SECRET_ENV_PATH.read_text(encoding="utf-8").splitlines():
-        line = line.strip()
-        if not line or line.startswith("#"):
-            continue
-        if line.startswith(key + "="):
-            return line.split("=", 1)[1].strip()
-    return default
+# secret.env is parsed and cached (mtime/size keyed) by user_secrets_store
 
 
 def load_shared_key() -> str:
@@ -89,36 +83,95 @@ def _user_profile_lines(role_name: str, priv: int) -> list[str]:
     return lines
 
 
-def _role_profile_block_lines(role_name: str, priv: int) -> list[str]:
-
-    role = (role_name or "OLT_VIEW").strip() or "OLT_VIEW"
-    p = max(1, min(15, int(priv)))
-
-    lines: list[str] = []
-    lines.append(f"  profile {role} {{")
-    lines.append("    script {")
+# ----- templates (each line ends with "\n"; {{ }} are literal braces) -----
+_HEADER = (
+    "# Auto-generated by NT TACACS+ Dashboard\n"
+    "# ห้ามแก้ไฟล์นี้ตรง ๆ (จะแทนที่ทุกครั้งที่ generate จาก web)\n"
+)
 
-    # Session authorization: set privilege at login
-    lines.append("      if (service == exec) {")
-    lines.append(f"        set priv-lvl = {p}")
-    lines.append("        permit")
-    lines.append("      }")
+_PASS_USER_TMPL = (
+    "\n"
+    "user {username} {{\n"
+    '  password login = clear "{password}"\n'
+    "  password pap = login\n"
+    "  member = {role}\n"
+    "}}\n"
+)
 
-    # Command authorization
-    lines.append("      if (service == shell) {")
-    lines.append('        if (cmd == "") permit')
-
-    if role == "OLT_VIEW":
-        lines.append(r'        if (cmd =~ /^configure(\s|$)/) deny')
-    elif role == "OLT_ENGINEER":
-        lines.append(r'        if (cmd =~ /^reload(\s|$)/) deny')
-
-    lines.append("        permit")
-    lines.append("      }")
-    lines.append("      permit")
-    lines.append("    }")
-    lines.append("  }")
-    return lines
+_CONFIG_HEAD_TMPL = (
+    "\n"
+    # spawnd
+    "id = spawnd {{\n"
+    "  listen = {{\n"
+    "    port = 49\n"
+    "  }}\n"
+    "}}\n"
+    "\n"
+    # tac_plus-ng
+    "id = tac_plus-ng {{\n"
+    "  # ----- Logging (authc/authz/acct/conn) -----\n"
+    "  log authclog {{ destination = {log_dir}/authc-%Y-%m-%d.log }}\n"
+    "  log authzlog {{ destination = {log_dir}/authz-%Y-%m-%d.log }}\n"
+    "  log acctlog  {{ destination = {log_dir}/acct-%Y-%m-%d.log }}\n"
+    "\n"
+    "  authentication log = authclog\n"
+    "  authorization log = authzlog\n"
+    "  accounting log = acctlog\n"
+    "\n"
+)
+
+_HOST_TMPL = (
+    "  host = {name} {{\n"
+    "    address = {address}\n"
+    '    key = "{key}"\n'
+    "  }}\n"
+    "\n"
+)
+
+_GROUP_TMPL = (
+    "  group = {name} {{\n"
+    "  }}\n"
+    "\n"
+)
+
+# Session authorization (service == exec): set privilege at login
+# Command authorization (service == shell): per-role deny line, then permit
+_ROLE_PROFILE_TMPL = (
+    "  profile {name} {{\n"
+    "    script {{\n"
+    "      if (service == exec) {{\n"
+    "        set priv-lvl = {priv}\n"
+    "        permit\n"
+    "      }}\n"
+    "      if (service == shell) {{\n"
+    '        if (cmd == "") permit\n'
+    "{deny}"
+    "        permit\n"
+    "      }}\n"
+    "      permit\n"
+    "    }}\n"
+    "  }}\n"
+    "\n"
+)
+
+_ROLE_DENY_LINES = {
+    "OLT_VIEW": "        if (cmd =~ /^configure(\\s|$)/) deny\n",
+    "OLT_ENGINEER": "        if (cmd =~ /^reload(\\s|$)/) deny\n",
+}
+
+_RULE_TMPL = "        if (member == {name}) {{ profile = {name} permit }}\n"
+
+_CONFIG_TAIL_TMPL = (
+    "        deny\n"  # safe default
+    "      }}\n"
+    "    }}\n"
+    "  }}\n"
+    "\n"
+    # include pass.secret
+    "  # Users are defined in separate pass.secret file\n"
+    '  include = "{pass_secret}"\n'
+    "}}"
+)
 
 
 def build_pass_secret_text() -> str:
@@ -127,136 +180,87 @@ def build_pass_secret_text() -> str:
     - ใส่ member = <ROLE>
     - ใส่ profile script ต่อ user (เพราะ group ใส่ profile ไม่ได้)
     """
-    policy = load_policy()
+    policy = load_policy_cached()
     users = policy.get("users", [])
-    roles = policy.get("roles", [])
 
-    default_pw = load_default_user_password()
-    role_priv = {(r.get("name") or "").strip(): _parse_privilege(r.get("privilege")) for r in roles}
+    parts: list[str] = [_HEADER]
 
-    lines: list[str] = []
-    lines.append("# Auto-generated by NT TACACS+ Dashboard")
-    lines.append("# ห้ามแก้ไฟล์นี้ตรง ๆ (จะแทนที่ทุกครั้งที่ generate จาก web)")
-    lines.append("")
+    # one read (and at most one write) of user_secrets.json for the whole file
+    with secrets_transaction():
+        for u in users:
+            username = (u.get("username") or u.get("name") or "").strip()
+            if not username:
+                continue
 
-    for u in users:
-        username = (u.get("username") or u.get("name") or "").strip()
-        if not username:
-            continue
+            status = (u.get("status") or "Active").strip().lower()
+            if status not in ("active", "enable", "enabled"):
+                continue
 
-        status = (u.get("status") or "Active").strip().lower()
-        if status not in ("active", "enable", "enabled"):
-            continue
+            role = (
+                u.get("roles")
+                or u.get("role")
+                or u.get("group")
+                or u.get("role_name")
+                or u.get("roleName")
+                or "OLT_VIEW"
+            )
+            role = str(role).strip() or "OLT_VIEW"
 
-        role = (
-            u.get("roles")
-            or u.get("role")
-            or u.get("group")
-            or u.get("role_name")
-            or u.get("roleName")
-            or "OLT_VIEW"
-        )
-        role = str(role).strip() or "OLT_VIEW"
+            ensure_user_has_password(username)
+            pw = get_user_password(username)
 
-        priv = role_priv.get(role, 1)
+            parts.append(_PASS_USER_TMPL.format(username=username, password=_escape(pw), role=role))
 
-        ensure_user_has_password(username)
-        pw = get_user_password(username)
-
-        lines.append(f"user {username} {{")
-        lines.append(f'  password login = clear "{_escape(pw)}"')
-        lines.append("  password pap = login")
-        lines.append(f"  member = {role}")
-        lines.append("}")
-        lines.append("")
-
-    return "\n".join(lines)
+    return "".join(parts)
 
 
 def build_config_text() -> str:
     """สร้าง tacacs-generated.cfg"""
-    policy = load_policy()
+    policy = load_policy_cached()
     roles = policy.get("roles", [])
     devices = policy.get("devices", [])
 
-    shared_key = load_shared_key()
-    enable15 = load_enable15_password()
-
-    lines: list[str] = []
-    lines.append("# Auto-generated by NT TACACS+ Dashboard")
-    lines.append("# ห้ามแก้ไฟล์นี้ตรง ๆ (จะแทนที่ทุกครั้งที่ generate จาก web)")
-    lines.append("")
-
-    # spawnd
-    lines.append("id = spawnd {")
-    lines.append("  listen = {")
-    lines.append("    port = 49")
-    lines.append("  }")
-    lines.append("}")
-    lines.append("")
+    key = _escape(load_shared_key())
 
-    # tac_plus-ng
-    lines.append("id = tac_plus-ng {")
-    lines.append("  # ----- Logging (authc/authz/acct/conn) -----")
-    lines.append(f"  log authclog {{ destination = {LOG_DIR}/authc-%Y-%m-%d.log }}")
-    lines.append(f"  log authzlog {{ destination = {LOG_DIR}/authz-%Y-%m-%d.log }}")
-    lines.append(f"  log acctlog  {{ destination = {LOG_DIR}/acct-%Y-%m-%d.log }}")
-    lines.append("")
-    lines.append("  authentication log = authclog")
-    lines.append("  authorization log = authzlog")
-    lines.append("  accounting log = acctlog")
-    lines.append("")
+    parts: list[str] = [_HEADER, _CONFIG_HEAD_TMPL.format(log_dir=LOG_DIR)]
 
     # Devices -> host
-    lines.append("  # ----- Devices (policy.devices -> host) -----")
-    for dev in devices:
-        name = dev.get("name") or dev.get("id") or "OLT_UNKNOWN"
-        addr = dev.get("address") or dev.get("ip") or "0.0.0.0"
-        lines.append(f"  host = {name} {{")
-        lines.append(f"    address = {addr}")
-        lines.append(f'    key = "{_escape(shared_key)}"')
-        lines.append("  }")
-        lines.append("")
-
-    #
+    parts.append("  # ----- Devices (policy.devices -> host) -----\n")
+    parts.extend(
+        _HOST_TMPL.format(
+            name=dev.get("name") or dev.get("id") or "OLT_UNKNOWN",
+            address=dev.get("address") or dev.get("ip") or "0.0.0.0",
+            key=key,
+        )
+        for dev in devices
+    )
+
     # Roles -> group + role_priv
-    lines.append("  # ----- Roles (as groups) -----")
+    parts.append("  # ----- Roles (as groups) -----\n")
     role_priv: dict[str, int] = {}
     for r in roles:
         name = (r.get("name") or "").strip()
         if not name:
             continue
         role_priv[name] = _parse_privilege(r.get("privilege"))
-        lines.append(f"  group = {name} {{")
-        lines.append("  }")
-        lines.append("")
+        parts.append(_GROUP_TMPL.format(name=name))
 
     # Profiles per role
-    lines.append("  # ----- Profiles (RBAC per role) -----")
-    for role_name, priv in role_priv.items():
-        lines.extend(_role_profile_block_lines(role_name, priv))
-        lines.append("")
+    parts.append("  # ----- Profiles (RBAC per role) -----\n")
+    parts.extend(
+        _ROLE_PROFILE_TMPL.format(name=name, priv=priv, deny=_ROLE_DENY_LINES.get(name, ""))
+        for name, priv in role_priv.items()
+    )
 
     # Ruleset: map member -> profile
-    lines.append("  # ----- Ruleset: member -> profile -----")
-    lines.append("  ruleset {")
-    lines.append("    rule {")
-    lines.append("      enabled = yes")
-    lines.append("      script {")
-    for role_name in role_priv.keys():
-        lines.append(f"        if (member == {role_name}) {{ profile = {role_name} permit }}")
-    lines.append("        deny")   # safe default
-    lines.append("      }")
-    lines.append("    }")
-    lines.append("  }")
-    lines.append("")
-
-
-    # include pass.secret
-    lines.append("  # Users are defined in separate pass.secret file")
-    lines.append(f'  include = "{PASS_SECRET_PATH}"')
-    lines.append("}")
-
-    return "\n".join(lines)
-
-
+    parts.append(
+        "  # ----- Ruleset: member -> profile -----\n"
+        "  ruleset {\n"
+        "    rule {\n"
+        "      enabled = yes\n"
+        "      script {\n"
+    )
+    parts.extend(_RULE_TMPL.format(name=name) for name in role_priv)
+    parts.append(_CONFIG_TAIL_TMPL.format(pass_secret=PASS_SECRET_PATH))
+
+    return "".join(parts)
@@ -1,52 +1,169 @@
 # tacacs_dashboard/services/user_secrets_store.py
 from __future__ import annotations
 
+import copy
 import json
 import os
+import re
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Iterator
+
+from ._fsutil import fsync_dir
+
+try:  # optional C encoder; stdlib json is the fallback
+    import orjson
+except ImportError:
+    orjson = None
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 SECRET_ENV_PATH = BASE_DIR / "secret.env"
 DEFAULT_SECRETS_PATH = BASE_DIR / "user_secrets.json"
 
 
+# Parsed secret.env, keyed on (st_mtime_ns, st_size).
+# secrets_path: resolved USER_SECRETS_JSON (None -> DEFAULT_SECRETS_PATH)
+_ENV_CACHE: Dict[str, Any] = {"key": None, "data": {}, "secrets_path": None}
+_ENV_LOCK = threading.Lock()
+
+
+# KEY=value per line; [^\S\n] = whitespace other than newline (so \r, tabs are trimmed too).
+# `#` comments and blank lines never match because a key must start the line.
+_ENV_LINE_RE = re.compile(r"^[^\S\n]*([A-Za-z_][A-Za-z0-9_]*)=[^\S\n]*(.*?)[^\S\n]*$", re.M)
+
+
+def _parse_env_text(text: str) -> Dict[str, str]:
+    """secret.env text -> {key: value}; one findall() pass, called once per file change."""
+    # reversed(): dict() keeps the last value per key, secret.env semantics are first-wins
+    return dict(reversed(_ENV_LINE_RE.findall(text)))
+
+
+def _env_entry() -> Dict[str, Any]:
+    """Consistent snapshot of _ENV_CACHE, re-parsing secret.env only when it changed."""
+    try:
+        st = SECRET_ENV_PATH.stat()
+    except FileNotFoundError:
+        key = None
+    else:
+        key = (st.st_mtime_ns, st.st_size)
+
+    with _ENV_LOCK:
+        if _ENV_CACHE["key"] != key:
+            data = _parse_env_text(SECRET_ENV_PATH.read_text(encoding="utf-8")) if key is not None else {}
+            p = (data.get("USER_SECRETS_JSON") or "").strip()
+            _ENV_CACHE.update(key=key, data=data, secrets_path=Path(p) if p else None)
+        return dict(_ENV_CACHE)
+
+
+def _load_env() -> Dict[str, str]:
+    """secret.env as a dict (shared, read-only)."""
+    return _env_entry()["data"]
+
+
 def _read_env(key: str, default: str = "") -> str:
-    if not SECRET_ENV_PATH.exists():
-        return default
-    for line in SECRET_ENV_PATH.read_text(encoding="utf-8").splitlines():
-        line = line.strip()
-        if not line or line.startswith("#"):
-            continue
-        if line.startswith(key + "="):
-            return line.split("=", 1)[1].strip()
-    return default
+    return _load_env().get(key, default)
 
 
 def _secrets_path() -> Path:
-    p = (_read_env("USER_SECRETS_JSON", "") or "").strip()
-    return Path(p) if p else DEFAULT_SECRETS_PATH
+    return _env_entry()["secrets_path"] or DEFAULT_SECRETS_PATH
 
 
 def _default_password_from_env() -> str:
     return _read_env("DEFAULT_USER_PASSWORD")
 
+# Last read of user_secrets.json, keyed on (path, st_mtime_ns, st_size).
+# data is never handed out directly: load_user_secrets() returns a deep copy.
+_SECRETS_CACHE: Dict[str, Any] = {"key": None, "data": None}
+_SECRETS_LOCK = threading.Lock()
+
+# per-thread secrets_transaction() state: data (working copy) + dirty
+_TXN = threading.local()
+
+
+def _secrets_key(path: Path):
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return (str(path), st.st_mtime_ns, st.st_size)
+
+
 def load_user_secrets() -> Dict[str, Any]:
+    """
+    คืน user_secrets.json เป็น dict ที่แก้ไขได้ (deep copy ของ cache)
+    ภายใน secrets_transaction() จะคืน working copy ของ transaction นั้นแทน
+    """
+    data = getattr(_TXN, "data", None)
+    if data is not None:
+        return data
+
     path = _secrets_path()
-    if not path.exists():
+    key = _secrets_key(path)
+    if key is None:
         return {"default_password": _default_password_from_env(), "users": {}}
-    with path.open("r", encoding="utf-8") as f:
-        return json.load(f)
 
+    with _SECRETS_LOCK:
+        if _SECRETS_CACHE["key"] != key:
+            with path.open("r", encoding="utf-8") as f:
+                _SECRETS_CACHE.update(key=key, data=json.load(f))
+        return copy.deepcopy(_SECRETS_CACHE["data"])
+
+
+def _encode_secrets(data: Dict[str, Any], pretty: bool) -> bytes:
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        return orjson.dumps(data, option=option) + b"\n"
+    return (json.dumps(data, ensure_ascii=False, indent=2 if pretty else None) + "\n").encode("utf-8")
+
+
+def save_user_secrets(data: Dict[str, Any], *, pretty: bool = True) -> None:
+    """
+    เขียน user_secrets.json (atomic + fsync)
+    pretty=False เขียนแบบไม่ย่อหน้า (เร็วกว่า แต่อ่านด้วยตายาก)
+    """
+    if getattr(_TXN, "data", None) is not None:
+        # written once when the outermost secrets_transaction() exits
+        _TXN.data = data
+        _TXN.dirty = True
+        return
 
-def save_user_secrets(data: Dict[str, Any]) -> None:
     path = _secrets_path()
     path.parent.mkdir(parents=True, exist_ok=True)
-    tmp = path.with_suffix(path.suffix + ".tmp")
-    with tmp.open("w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-        f.write("\n")
-    os.replace(tmp, path)
+    snapshot = copy.deepcopy(data)
+    with _SECRETS_LOCK:
+        _SECRETS_CACHE.update(key=None, data=snapshot)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with tmp.open("wb") as f:
+            f.write(_encode_secrets(data, pretty))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        _SECRETS_CACHE["key"] = _secrets_key(path)
+
+    fsync_dir(path.parent)
+
+
+@contextmanager
+def secrets_transaction() -> Iterator[Dict[str, Any]]:
+    """
+    โหลด user_secrets.json ครั้งเดียว ให้ทุก get/set/ensure ในบล็อกใช้ข้อมูลชุดเดียวกัน
+    แล้วเขียนไฟล์ครั้งเดียวตอนออกจากบล็อก (ถ้ามีการแก้ไข)
+    ถ้าเกิด exception จะไม่เขียนอะไรเลย; ซ้อนกันได้ (บล็อกในสุดไม่ทำอะไรเพิ่ม)
+    """
+    if getattr(_TXN, "data", None) is not None:
+        yield _TXN.data
+        return
+
+    _TXN.data = load_user_secrets()
+    _TXN.dirty = False
+    try:
+        yield _TXN.data
+        data, dirty = _TXN.data, _TXN.dirty
+    finally:
+        _TXN.data = None
+    if dirty:
+        save_user_secrets(data)
 
 
 def get_default_password() -> str:
@@ -1,83 +1,219 @@
 # tacacs_dashboard/services/web_terminal.py
 from __future__ import annotations
 
+import hashlib
+import heapq
+import hmac
+import itertools
+import os
 import re
+import selectors
 import time
 import uuid
 import threading
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, List, Tuple
 
 import pexpect
 
-from .policy_store import load_policy
-from .tacacs_config import _parse_privilege
+from .policy_store import (
+    get_device_ip,
+    get_device_send_delay,
+    get_role_priv,
+    get_user_role,
+    policy_snapshot,
+)
+from .user_secrets_store import get_user_password
+from ._cli_patterns import DENIED_PAT, LOGIN_PAT, PASS_PAT, PROMPT_PAT
+
+# "\\xHH" strings the UI sends for control keys (Ctrl-C/D/Z, Esc, ...) -> the raw character,
+# every code 00-ff in any hex-digit case, so send_line needs one dict lookup
+_CTRL_MAP = {
+    f"\\x{hi}{lo}": chr(i)
+    for i in range(256)
+    for hi in {f"{i >> 4:x}", f"{i >> 4:X}"}
+    for lo in {f"{i & 15:x}", f"{i & 15:X}"}
+}
+
+# The child runs in bytes mode (output is decoded once per call, not per chunk),
+# so the shared pattern sources are compiled as bytes here.
+PROMPT_RE = re.compile(PROMPT_PAT.encode(), re.M)
+MORE_RE = re.compile(rb"--More--")
+
+# Login stages as one regex each: a single scan per chunk, branch on match.lastgroup
+_LOGIN_STAGE_RE = re.compile(
+    rf"(?P<login>{LOGIN_PAT})|(?P<password>{PASS_PAT})|(?P<prompt>{PROMPT_PAT})|(?P<denied>{DENIED_PAT})".encode(),
+    re.M,
+)
+_PASSWORD_STAGE_RE = re.compile(rf"(?P<password>{PASS_PAT})|(?P<denied>{DENIED_PAT})".encode())
+_PROMPT_STAGE_RE = re.compile(rf"(?P<prompt>{PROMPT_PAT})|(?P<denied>{DENIED_PAT})".encode(), re.M)
+
+# Pattern lists already in compile_pattern_list() form, passed to child.expect_list()
+# so pexpect doesn't rebuild the list on every expect()
+_LOGIN_EXPECT = [_LOGIN_STAGE_RE, pexpect.TIMEOUT, pexpect.EOF]
+_PASSWORD_EXPECT = [_PASSWORD_STAGE_RE, pexpect.TIMEOUT, pexpect.EOF]
+_AFTER_LOGIN_EXPECT = [_PROMPT_STAGE_RE, pexpect.TIMEOUT, pexpect.EOF]
+_PROBE_EXPECT = [PROMPT_RE, pexpect.TIMEOUT, pexpect.EOF]
+_OUTPUT_EXPECT = [PROMPT_RE, MORE_RE, pexpect.TIMEOUT]
+_PAGING_EXPECT = [PROMPT_RE, MORE_RE, pexpect.TIMEOUT, pexpect.EOF]
+_BS_COLLAPSE_RE = re.compile(r"[^\x08]\x08")
+
+class _Session:
+    """One web terminal session (slots: no per-instance __dict__, attribute access by offset)."""
+
+    __slots__ = (
+        "child",
+        "lock",  # serializes send/expect on this child
+        "device_ip",
+        "username",
+        "role",
+        "enable_level",  # kept for backwards compatibility with UI
+        "created",
+        "last_access",
+        # for returning the connection to _POOL on close
+        "connected",
+        "pw_salt",
+        "pw_digest",
+        "policy_key",
+        "closed",  # set under `lock` once the child is closed or pooled
+    )
+
+    def __init__(self, **fields: Any) -> None:
+        for name, value in fields.items():
+            setattr(self, name, value)
 
-# ZTE prompt: '>' (user exec) / '#' (privileged exec)
-PROMPT_RE = re.compile(r"[>#]\s*$", re.M)
-PASS_RE = re.compile(r"(?i)password:")
-LOGIN_RE = re.compile(r"(?i)(username:|login:)")
-DENIED_RE = re.compile(r"(?i)(denied|failed|not authorized|invalid|incorrect|authentication failed|login incorrect)")
-MORE_RE = re.compile(r"--More--")
 
 # In-memory sessions (⚠️ reliable only with a single gunicorn worker, or sticky sessions)
-_SESSIONS: Dict[str, Dict[str, Any]] = {}
-_LOCK = threading.RLock()
+_SESSIONS: Dict[str, _Session] = {}
+_LOCK = threading.Lock()  # guards _SESSIONS / _EXPIRY_HEAP membership only
 
 # Session idle timeout (seconds)
 IDLE_TTL = 15 * 60  # 15 minutes
 
-
-def _cap(child: pexpect.spawn) -> str:
-    """Capture child.before/after safely (after can be pexpect.TIMEOUT/EOF types)."""
-    before = child.before or ""
-    after = child.after if isinstance(child.after, str) else ""
-    return before + after
+# (deadline, sid) min-heap, one entry per live session (guarded by _LOCK).
+# Deadlines are lazy: an entry whose session was touched since is pushed
+# back with last_access + IDLE_TTL when it reaches the top.
+_EXPIRY_HEAP: list[tuple[float, str]] = []
+
+# Max bytes per pty read (drains and pexpect's own expect reads): a full
+# `show` screen in one read() instead of many 2-4 KB ones
+READ_CHUNK = 65536
+
+# Logged-in connections parked by close_session(), keyed by (device_ip, username),
+# so reopening the same device skips the telnet login (guarded by _LOCK)
+POOL_MAX_SIZE = 2  # per key
+POOL_IDLE_TTL = 5 * 60  # seconds parked before it is closed
+POOL_MAX_AGE = 30 * 60  # seconds since login, parked or not
+POOL_PROBE_TIMEOUT = 0.3
+_POOL: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+
+# (deadline, seq, entry) min-heap, one item per parked entry (guarded by _LOCK).
+# Items whose entry was checked out again are skipped when they reach the top.
+_POOL_HEAP: list[tuple[float, int, Dict[str, Any]]] = []
+_POOL_SEQ = itertools.count()  # tie-breaker: entries themselves don't compare
+
+# Idle sessions are closed by a background reaper, not on the request path
+REAPER_INTERVAL = 30  # seconds
+_REAPER_STARTED = False
+
+
+def _cap(child: pexpect.spawn, out: bytearray) -> None:
+    """Append child.before/after to `out` (after can be pexpect.TIMEOUT/EOF types)."""
+    if child.before:
+        out += child.before
+    if isinstance(child.after, bytes):
+        out += child.after
+    elif child.after is pexpect.TIMEOUT:
+        # a timed-out expect() keeps its data pending and would serve it again next time
+        child.buffer = child.string_type()
+        child._before = child.buffer_type()
 
 
 def _cleanup_expired() -> None:
     now = time.time()
-    expired = []
+    doomed: list[pexpect.spawn | None] = []  # closed after _LOCK is released
     with _LOCK:
-        for sid, s in _SESSIONS.items():
-            if now - float(s.get("last_access", now)) > IDLE_TTL:
-                expired.append(sid)
-        for sid in expired:
-            _close_nolock(sid)
+        while _EXPIRY_HEAP and _EXPIRY_HEAP[0][0] <= now:
+            _, sid = heapq.heappop(_EXPIRY_HEAP)
+            s = _SESSIONS.get(sid)
+            if not s:
+                continue  # closed already
+            deadline = s.last_access + IDLE_TTL
+            if deadline < now:
+                doomed.append(_detach_nolock(sid))
+            else:
+                heapq.heappush(_EXPIRY_HEAP, (deadline, sid))
+
+        while _POOL_HEAP and _POOL_HEAP[0][0] <= now:
+            _, _, e = heapq.heappop(_POOL_HEAP)
+            entries = _POOL.get(e["key"]) or []
+            for i, parked in enumerate(entries):
+                if parked is e:
+                    del entries[i]
+                    doomed.append(e["child"])
+                    break
+            else:
+                continue  # checked out since
+            if not entries:
+                _POOL.pop(e["key"], None)
 
+    # close(force=True) can block on kill/waitpid; don't hold up other requests meanwhile
+    for child in doomed:
+        _close_child(child)
+
+
+def _reaper_loop() -> None:
+    while True:
+        time.sleep(REAPER_INTERVAL)
+        try:
+            _cleanup_expired()
+        except Exception:
+            pass  # keep reaping; a failing close() must not kill the thread
 
-def _device_ip_from_policy(device_name_or_ip: str) -> str:
+
+def _ensure_reaper() -> None:
+    """Start (once) the daemon thread that closes idle sessions."""
+    global _REAPER_STARTED
+    with _LOCK:
+        if _REAPER_STARTED:
+            return
+        _REAPER_STARTED = True
+    threading.Thread(target=_reaper_loop, name="web-terminal-reaper", daemon=True).start()
+
+
+def _looks_like_ipv4(s: str) -> bool:
+    """Dotted quad of 1-3 ASCII digits each (no regex; values aren't range-checked)."""
+    parts = s.split(".")
+    return len(parts) == 4 and all(0 < len(p) <= 3 and p.isascii() and p.isdigit() for p in parts)
+
+
+def _device_ip_from_policy(device_name_or_ip: str, snapshot: Dict[str, Any] | None = None) -> str:
     target = (device_name_or_ip or "").strip()
     if not target:
         raise ValueError("Device is required")
 
     # if looks like an IP, accept directly
-    if re.match(r"^\d{1,3}(\.\d{1,3}){3}$", target):
+    if _looks_like_ipv4(target):
         return target
 
-    policy = load_policy()
-    for d in policy.get("devices", []):
-        if (d.get("name") or "").strip() == target:
-            ip = (d.get("ip") or d.get("address") or "").strip()
-            if ip:
-                return ip
+    ip = get_device_ip(target, snapshot)
+    if ip:
+        return ip
     raise ValueError("Device not found in policy.json")
 
 
-def _role_for_user(username: str) -> str:
-    policy = load_policy()
-    for u in policy.get("users", []):
-        if (u.get("username") or "").strip().lower() == username.strip().lower():
-            return (u.get("roles") or u.get("role") or "").strip()
+def _role_for_user(username: str, snapshot: Dict[str, Any] | None = None) -> str:
+    role = get_user_role(username, snapshot)
+    if role is not None:
+        return role
     raise ValueError("User not found in policy.json (add user in dashboard first)")
 
 
-def _priv_level_for_role(role: str) -> int:
+def _priv_level_for_role(role: str, snapshot: Dict[str, Any] | None = None) -> int:
     """Return intended privilege from policy.roles. Fallback: VIEW=1, ENGINEER=7, else 15."""
     role = (role or "").strip()
-    policy = load_policy()
-    for r in policy.get("roles", []):
-        if (r.get("name") or "").strip().upper() == role.upper():
-            return _parse_privilege(r.get("privilege"))
+    priv = get_role_priv(role, snapshot)
+    if priv is not None:
+        return priv
 
     # fallback
     ru = role.upper()
@@ -88,152 +224,340 @@ def _priv_level_for_role(role: str) -> int:
     return 15
 
 
-def _read_nonblocking(child: pexpect.spawn, budget_s: float = 0.25, chunk_size: int = 4096) -> str:
-    """Read output for a short time window without blocking."""
-    end = time.time() + budget_s
-    out = []
-    while time.time() < end:
-        try:
-            data = child.read_nonblocking(size=chunk_size, timeout=0.05)
-            if data:
-                out.append(data)
-                # Auto-handle --More--
-                if "--More--" in data:
-                    child.send(" ")
-                    continue
-            else:
+def _resolve(device: str, username: str) -> Tuple[str, str, int, float | None, Any]:
+    """(device_ip, role, privilege_level, send_delay, policy_key) from one policy snapshot."""
+    snap = policy_snapshot()
+    device_ip = _device_ip_from_policy(device, snap)
+    role = _role_for_user(username, snap)
+    level = _priv_level_for_role(role, snap)
+    send_delay = get_device_send_delay(device, snap) or get_device_send_delay(device_ip, snap)
+    return device_ip, role, level, send_delay, snap["key"]
+
+
+def _at_prompt(s: bytes) -> bool:
+    """True when `s` ends at a CLI prompt ('>' or '#' plus trailing whitespace).
+
+    Same test as PROMPT_RE at the end of `s`, without running a regex over it;
+    PROMPT_RE itself stays for pexpect.expect().
+    """
+    return s.rstrip()[-1:] in (b">", b"#")
+
+
+def _read_nonblocking(
+    child: pexpect.spawn,
+    budget_s: float = 0.25,
+    chunk_size: int = READ_CHUNK,
+    *,
+    out: bytearray | None = None,
+) -> bytearray:
+    """Read whatever output arrives within `budget_s` without blocking.
+
+    Sleeps in select() on the pty until data is there, stops after 50 ms of
+    silence, and returns early once the output ends at a prompt.
+    Appends to `out` when given (and returns it), so callers build one buffer.
+    """
+    if out is None:
+        out = bytearray()
+
+    end = time.monotonic() + budget_s
+    with selectors.DefaultSelector() as sel:
+        sel.register(child.child_fd, selectors.EVENT_READ)
+        while True:
+            remaining = end - time.monotonic()
+            if remaining <= 0 or not sel.select(min(remaining, 0.05)):
                 break
-        except pexpect.TIMEOUT:
+            try:
+                data = child.read_nonblocking(size=chunk_size, timeout=0)
+            except (pexpect.TIMEOUT, pexpect.EOF):
+                break
+            if not data:
+                break
+            out += data
+            # Auto-handle --More--
+            if b"--More--" in data:
+                child.send(" ")
+                continue
+            if _at_prompt(data):
+                break  # back at the prompt; nothing more is coming
+    return out
+
+
+def _read_until_prompt(child: pexpect.spawn, budget_s: float = 0.4, *, out: bytearray | None = None) -> bytearray:
+    """Let pexpect wait for the prompt (answering --More-- pages) within `budget_s`.
+
+    For output that is known to still be coming, e.g. after paging past --More--:
+    returns as soon as the prompt shows up instead of waiting out a quiet window.
+    Appends to `out` when given (and returns it).
+    """
+    if out is None:
+        out = bytearray()
+    end = time.monotonic() + budget_s
+    while True:
+        remaining = end - time.monotonic()
+        if remaining <= 0:
             break
-        except pexpect.EOF:
+        idx = child.expect_list(_PAGING_EXPECT, timeout=remaining)
+        _cap(child, out)
+        if idx != 1:
             break
-    return "".join(out)
+        child.send(" ")
+    return out
 
 
 # --- ANSI / cursor-control cleanup ---
 # (helps when user runs help like: `pon ?` which some CLIs print with cursor moves)
+# one pass: the CSI branch also covers cursor moves like ESC[2K / ESC[1A
 _ANSI_RE = re.compile(
-    r"\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])"  # CSI/ESC sequences
+    rb"\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])"  # CSI/ESC sequences
 )
-_CSI_MOVE_RE = re.compile(r"\x1B\[[0-9;]*[A-Za-z]")
 
 
-def _strip_ansi(s: str) -> str:
-    if not s:
+def _strip_ansi(b: bytes | bytearray) -> str:
+    """Raw pty output -> text: newlines normalized, escapes dropped, decoded once."""
+    if not b:
         return ""
-    s = s.replace("\r\n", "\n").replace("\r", "\n")
-    s = _ANSI_RE.sub("", s)
-    s = _CSI_MOVE_RE.sub("", s)
-    return s
+    b = b.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+    return _ANSI_RE.sub(b"", b).decode("utf-8", errors="replace")
 
 
 def _normalize_backspaces(s: str) -> str:
-    if not s:
-        return ""
-    buf: list[str] = []
-    for ch in s:
-        if ch == "\b":
-            if buf:
-                buf.pop()
-        else:
-            buf.append(ch)
-    return "".join(buf)
+    # common case: nothing to do
+    if not s or "\b" not in s:
+        return s or ""
+    # each pass erases "<char><BS>" pairs; repeat for runs like "abc\b\b\b"
+    while True:
+        collapsed = _BS_COLLAPSE_RE.sub("", s)
+        if collapsed == s:
+            break
+        s = collapsed
+    # whatever is left are backspaces with nothing before them
+    return s.replace("\b", "")
 
 
-def create_session(
-    device: str,
-    username: str,
-    password: str,
-    *,
-    timeout: int = 10,
-) -> Tuple[str, str, str, int, str]:
-    """Create interactive telnet session.
+def _password_digest(password: str, salt: bytes) -> bytes:
+    return hashlib.sha256(salt + (password or "").encode("utf-8")).digest()
 
-    NOTE: We no longer auto-send `enable <level>` here.
-    Your TACACS profile now sets privilege (priv-lvl) at login.
 
-    Returns: (session_id, role, device_ip, privilege_level, output)
-    """
-    _cleanup_expired()
-
-    username = (username or "").strip()
-    if not username:
-        raise ValueError("username required")
+def _close_child(child: pexpect.spawn | None) -> None:
+    try:
+        if child is not None:
+            child.close(force=True)
+    except Exception:
+        pass
 
-    device_ip = _device_ip_from_policy(device)
-    role = _role_for_user(username)
-    level = _priv_level_for_role(role)
 
-    child = pexpect.spawn("/usr/bin/telnet", [device_ip], encoding="utf-8", timeout=timeout)
-    child.delaybeforesend = 0.05
+def _login(device_ip: str, username: str, password: str, send_delay: float | None, timeout: int) -> Tuple[pexpect.spawn, bytearray]:
+    """Spawn telnet and log in; returns (child, raw output). Raises RuntimeError on failure."""
+    child = pexpect.spawn("/usr/bin/telnet", [device_ip], timeout=timeout, maxread=READ_CHUNK)
+    # no artificial pause before each send unless this device needs one (policy send_delay)
+    child.delaybeforesend = send_delay
 
-    output = ""
+    out = bytearray()
 
     # Wait for Username/Login prompt
-    idx = child.expect([LOGIN_RE, PASS_RE, PROMPT_RE, DENIED_RE, pexpect.TIMEOUT, pexpect.EOF], timeout=timeout)
-    output += _cap(child)
-    if idx == 4:
+    idx = child.expect_list(_LOGIN_EXPECT, timeout=timeout)
+    _cap(child, out)
+    if idx == 1:
         child.close(force=True)
         raise RuntimeError("Timeout waiting for Username prompt")
-    if idx == 5:
+    if idx == 2:
         child.close(force=True)
         raise RuntimeError("Connection closed (EOF) while waiting for login")
-    if idx == 3:
+    stage = child.match.lastgroup
+    if stage == "denied":
         child.close(force=True)
         raise RuntimeError("Login denied")
 
     # If device asks for username
-    if idx == 0:
+    if stage == "login":
         child.sendline(username)
-        idx2 = child.expect([PASS_RE, DENIED_RE, pexpect.TIMEOUT, pexpect.EOF], timeout=timeout)
-        output += _cap(child)
+        idx2 = child.expect_list(_PASSWORD_EXPECT, timeout=timeout)
+        _cap(child, out)
         if idx2 == 1:
-            child.close(force=True)
-            raise RuntimeError("Login denied")
-        if idx2 == 2:
             child.close(force=True)
             raise RuntimeError("Timeout waiting for Password prompt")
-        if idx2 == 3:
+        if idx2 == 2:
             child.close(force=True)
             raise RuntimeError("Connection closed (EOF) while waiting for password")
+        if child.match.lastgroup == "denied":
+            child.close(force=True)
+            raise RuntimeError("Login denied")
 
     # If it was already at password prompt, continue
     child.sendline(password)
 
     # Wait for prompt after login
-    idx3 = child.expect([PROMPT_RE, DENIED_RE, pexpect.TIMEOUT, pexpect.EOF], timeout=timeout * 2)
-    output += _cap(child)
+    idx3 = child.expect_list(_AFTER_LOGIN_EXPECT, timeout=timeout * 2)
+    _cap(child, out)
     if idx3 == 1:
-        child.close(force=True)
-        raise RuntimeError("Login denied")
-    if idx3 == 2:
         child.close(force=True)
         raise RuntimeError("Timeout waiting for prompt after login")
-    if idx3 == 3:
+    if idx3 == 2:
         child.close(force=True)
         raise RuntimeError("Connection closed (EOF) after login")
+    if child.match.lastgroup == "denied":
+        child.close(force=True)
+        raise RuntimeError("Login denied")
 
     # Read any remaining data quickly
-    output += _read_nonblocking(child, budget_s=0.2)
+    _read_nonblocking(child, budget_s=0.2, out=out)
+    return child, out
+
+
+def _pool_checkout(
+    key: Tuple[str, str],
+    password: str,
+    role: str,
+    level: int,
+    policy_key: Any,
+) -> Tuple[Dict[str, Any], bytearray] | None:
+    """Take a pooled, still-logged-in connection for `key` if it may be reused.
+
+    Reuse needs the same password the connection logged in with (and that
+    password must still be the user's current one), an unchanged policy.json
+    (role/status edits must not be bypassed) and a prompt answering a probe.
+    """
+    if not password or not hmac.compare_digest(
+        password.encode("utf-8"), get_user_password(key[1]).encode("utf-8")
+    ):
+        return None
+
+    now = time.time()
+    entry = None
+    with _LOCK:
+        entries = _POOL.get(key) or []
+        for i, e in enumerate(entries):
+            if (
+                e["policy_key"] == policy_key
+                and e["role"] == role
+                and e["enable_level"] == level
+                and hmac.compare_digest(e["pw_digest"], _password_digest(password, e["pw_salt"]))
+            ):
+                entry = entries.pop(i)
+                break
+        if not entries:
+            _POOL.pop(key, None)
+    if entry is None:
+        return None
+
+    child: pexpect.spawn = entry["child"]
+    if now - entry["connected"] > POOL_MAX_AGE or not child.isalive():
+        _close_child(child)
+        return None
+
+    # drop whatever the previous session left unread, then check the CLI still answers
+    if not _probe_exec_prompt(child, "\r"):
+        _close_child(child)
+        return None
+    out = bytearray()
+    _cap(child, out)
+    return entry, out
+
+
+def _probe_exec_prompt(child: pexpect.spawn, text: str) -> bool:
+    """Send `text` and check the CLI answers with an exec prompt ('>'/'#', not a '(config...)' mode)."""
+    try:
+        _read_nonblocking(child, budget_s=0.05)
+        child.send(text)
+        idx = child.expect_list(_PROBE_EXPECT, timeout=POOL_PROBE_TIMEOUT)
+    except Exception:
+        return False
+    if idx != 0:
+        return False
+    prompt_line = (child.before or b"").rsplit(b"\n", 1)[-1]
+    return b"(" not in prompt_line
+
+
+def _pool_checkin_nolock(s: _Session) -> bool:
+    """Park a closed session's connection in _POOL.
+
+    Caller holds _LOCK and the session's io lock. False = close it instead.
+    """
+    child = s.child
+    now = time.time()
+    if not child.isalive() or now - s.connected > POOL_MAX_AGE:
+        return False
+    entries = _POOL.setdefault((s.device_ip, s.username), [])
+    if len(entries) >= POOL_MAX_SIZE:
+        return False
+    entry = {
+        "key": (s.device_ip, s.username),
+        "child": child,
+        "pw_salt": s.pw_salt,
+        "pw_digest": s.pw_digest,
+        "policy_key": s.policy_key,
+        "role": s.role,
+        "enable_level": s.enable_level,
+        "connected": s.connected,
+        "returned": now,
+    }
+    entries.append(entry)
+    deadline = min(now + POOL_IDLE_TTL, s.connected + POOL_MAX_AGE)
+    heapq.heappush(_POOL_HEAP, (deadline, next(_POOL_SEQ), entry))
+    return True
+
+
+def create_session(
+    device: str,
+    username: str,
+    password: str,
+    *,
+    timeout: int = 10,
+) -> Tuple[str, str, str, int, str]:
+    """Create interactive telnet session.
+
+    NOTE: We no longer auto-send `enable <level>` here.
+    Your TACACS profile now sets privilege (priv-lvl) at login.
+
+    A connection left in the pool by close_session() for the same device,
+    username and password is reused instead of logging in again.
+
+    Returns: (session_id, role, device_ip, privilege_level, output)
+    """
+    _ensure_reaper()
+
+    username = (username or "").strip()
+    if not username:
+        raise ValueError("username required")
+
+    device_ip, role, level, send_delay, policy_key = _resolve(device, username)
+
+    pooled = _pool_checkout((device_ip, username), password, role, level, policy_key)
+    if pooled is not None:
+        entry, output = pooled
+        child = entry["child"]
+        salt, digest, connected = entry["pw_salt"], entry["pw_digest"], entry["connected"]
+    else:
+        child, output = _login(device_ip, username, password, send_delay, timeout)
+        salt = os.urandom(16)
+        digest = _password_digest(password, salt)
+        connected = time.time()
 
     sid = uuid.uuid4().hex
+    now = time.time()
     with _LOCK:
-        _SESSIONS[sid] = {
-            "child": child,
-            "device_ip": device_ip,
-            "username": username,
-            "role": role,
-            "enable_level": level,  # kept for backwards compatibility with UI
-            "created": time.time(),
-            "last_access": time.time(),
-        }
+        _SESSIONS[sid] = _Session(
+            child=child,
+            lock=threading.Lock(),
+            device_ip=device_ip,
+            username=username,
+            role=role,
+            enable_level=level,
+            created=now,
+            last_access=now,
+            connected=connected,
+            pw_salt=salt,
+            pw_digest=digest,
+            policy_key=policy_key,
+            closed=False,
+        )
+        heapq.heappush(_EXPIRY_HEAP, (now + IDLE_TTL, sid))
 
     return sid, role, device_ip, level, _strip_ansi(output)
 
 
 def send_line(session_id: str, line: str, *, timeout: int = 10) -> str:
     """Send a command (or control) to an existing session and return output."""
-    _cleanup_expired()
     sid = (session_id or "").strip()
     if not sid:
         raise ValueError("session_id required")
@@ -242,36 +566,49 @@ def send_line(session_id: str, line: str, *, timeout: int = 10) -> str:
         s = _SESSIONS.get(sid)
         if not s:
             raise KeyError("session not found")
-        s["last_access"] = time.time()
-        child: pexpect.spawn = s["child"]
+        now = time.time()
+        expired = now - s.last_access > IDLE_TTL
+        if expired:
+            # idle past the TTL but the reaper hasn't run yet
+            _detach_nolock(sid)
+        else:
+            s.last_access = now
+        child = s.child
+        io_lock = s.lock
+
+    if expired:
+        _close_child(child)
+        raise KeyError("session not found")
 
     if line is None:
         line = ""
     line = str(line)
 
-    # Allow raw control like \x03 etc. If user passes "\\x03" string, convert.
-    if line.startswith("\\x") and len(line) == 4:
-        try:
-            child.send(bytes([int(line[2:], 16)]).decode("latin1"))
-        except Exception:
-            child.send(line)
-    else:
-        child.sendline(line)
+    # one command at a time per session; other sessions are not blocked
+    with io_lock:
+        if s.closed:
+            raise KeyError("session not found")  # closed while we waited for the lock
 
-    out = ""
-    try:
-        idx = child.expect([PROMPT_RE, MORE_RE, pexpect.TIMEOUT], timeout=0.6)
-        out += _cap(child)
-        if idx == 1:
-            child.send(" ")
-            out += _read_nonblocking(child, budget_s=0.4)
+        # Allow raw control like \x03 etc. If user passes "\\x03" string, convert.
+        ch = _CTRL_MAP.get(line)
+        if ch is not None:
+            child.send(ch)
         else:
-            out += _read_nonblocking(child, budget_s=0.2)
-    except Exception:
-        out += _read_nonblocking(child, budget_s=0.2)
+            child.sendline(line)
 
-    out = _normalize_backspaces(_strip_ansi(out))
-    return out
+        out = bytearray()
+        try:
+            idx = child.expect_list(_OUTPUT_EXPECT, timeout=0.6)
+            _cap(child, out)
+            if idx == 1:
+                child.send(" ")
+                _read_until_prompt(child, budget_s=0.4, out=out)
+            else:
+                _read_nonblocking(child, budget_s=0.2, out=out)
+        except Exception:
+            _read_nonblocking(child, budget_s=0.2, out=out)
+
+    return _normalize_backspaces(_strip_ansi(out))
 
 
 def get_session_meta(session_id: str) -> Dict[str, Any]:
@@ -284,28 +621,38 @@ def get_session_meta(session_id: str) -> Dict[str, Any]:
         if not s:
             raise KeyError("session not found")
         return {
-            "device_ip": s.get("device_ip"),
-            "username": s.get("username"),
-            "role": s.get("role"),
-            "enable_level": s.get("enable_level"),
-            "created": s.get("created"),
-            "last_access": s.get("last_access"),
+            "device_ip": s.device_ip,
+            "username": s.username,
+            "role": s.role,
+            "enable_level": s.enable_level,
+            "created": s.created,
+            "last_access": s.last_access,
         }
 
 
-def _close_nolock(session_id: str) -> None:
+def _detach_nolock(session_id: str) -> pexpect.spawn | None:
+    """Remove a session (caller holds _LOCK); returns its child for the caller to close outside the lock."""
     s = _SESSIONS.pop(session_id, None)
     if not s:
-        return
-    child = s.get("child")
-    try:
-        if child is not None:
-            child.close(force=True)
-    except Exception:
-        pass
+        return None
+    s.closed = True
+    return s.child
 
 
 def close_session(session_id: str) -> None:
+    """End a session; its logged-in connection goes back to the pool when possible."""
     with _LOCK:
-        _close_nolock(session_id)
+        s = _SESSIONS.pop(session_id, None)
+    if not s:
+        return
+
+    parked = False
+    with s.lock:  # waits for a send_line() still running on this child
+        s.closed = True  # a send_line() queued on the lock must not use a pooled child
+        # leave config/interface modes so the next holder starts at the exec prompt
+        if s.child.isalive() and _probe_exec_prompt(s.child, "end\r"):
+            with _LOCK:
+                parked = _pool_checkin_nolock(s)
+    if not parked:
+        _close_child(s.child)
 
@@ -1,13 +1,25 @@
 from __future__ import annotations
 
+import functools
 import json
 import os
+import threading
 from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
 from werkzeug.security import check_password_hash, generate_password_hash
 
+from ._fsutil import fsync_dir
+
+try:  # optional: argon2id hashes for new passwords; werkzeug pbkdf2/scrypt is the fallback
+    from argon2 import PasswordHasher
+    from argon2.exceptions import InvalidHashError, VerificationError
+
+    _ARGON2 = PasswordHasher()
+except ImportError:
+    _ARGON2 = None
+
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 
@@ -28,11 +40,17 @@ def _users_path() -> Path:
     return BASE_DIR / "web_users.json"
 
 
-def load_web_users() -> Dict[str, Any]:
-    path = _users_path()
-    if not path.exists():
-        return {"version": 1, "users": []}
-    raw = path.read_text(encoding="utf-8").strip()
+# Last read of web_users.json, keyed on (path, st_mtime_ns, st_size).
+# - raw:           file text; load_web_users() parses it again so callers get a dict they may mutate
+# - data:          parsed file, shared -> treat as read-only
+# - users_by_name: stripped username -> user record in data (first match wins)
+# - sorted_users:  data["users"] in list_users() order
+_CACHE: Dict[str, Any] = {"key": None, "raw": "", "data": None, "users_by_name": {}, "sorted_users": []}
+_CACHE_LOCK = threading.Lock()
+
+
+def _parse_web_users(raw: str) -> Dict[str, Any]:
+    raw = raw.strip()
     if not raw:
         return {"version": 1, "users": []}
     try:
@@ -44,12 +62,92 @@ def load_web_users() -> Dict[str, Any]:
     return data
 
 
+def _build_users_by_name(data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    by_name: Dict[str, Dict[str, Any]] = {}
+    for u in data.get("users") or []:
+        by_name.setdefault((u.get("username") or "").strip(), u)
+    return by_name
+
+
+def _user_sort_key(u: Dict[str, Any]):
+    # sort: superadmin first, then admin, then username
+    r = (u.get("role") or "").strip().lower()
+    bucket = 0 if r == ROLE_SUPERADMIN else (1 if r == ROLE_ADMIN else 2)
+    return (bucket, (u.get("username") or ""))
+
+
+def _users_key(path: Path):
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return (str(path), st.st_mtime_ns, st.st_size)
+
+
+def _fill_cache_nolock(key, raw: str) -> None:
+    data = _parse_web_users(raw)
+    _CACHE.update(
+        key=key,
+        raw=raw,
+        data=data,
+        users_by_name=_build_users_by_name(data),
+        sorted_users=sorted(data.get("users") or [], key=_user_sort_key),
+    )
+
+
+def _cache_entry() -> Dict[str, Any]:
+    """Consistent snapshot of _CACHE, re-reading web_users.json only when it changed."""
+    path = _users_path()
+    key = _users_key(path)
+    if key is None:
+        data = _parse_web_users("")
+        return {"key": None, "raw": "", "data": data, "users_by_name": {}, "sorted_users": []}
+
+    with _CACHE_LOCK:
+        if _CACHE["key"] != key:
+            _fill_cache_nolock(key, path.read_text(encoding="utf-8"))
+        return dict(_CACHE)
+
+
+def load_web_users() -> Dict[str, Any]:
+    """Return web_users.json as a fresh dict (safe to mutate and pass to save_web_users)."""
+    return _parse_web_users(_cache_entry()["raw"])
+
+
 def save_web_users(data: Dict[str, Any]) -> None:
+    """Write web_users.json (atomic + fsync); a no-op when the content is unchanged."""
     path = _users_path()
-    path.parent.mkdir(parents=True, exist_ok=True)
-    tmp = path.with_suffix(".tmp")
-    tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
-    tmp.replace(path)
+    blob = json.dumps(data, ensure_ascii=False, indent=2)
+    with _CACHE_LOCK:
+        if _CACHE["key"] is not None and _CACHE["key"] == _users_key(path) and _CACHE["raw"] == blob:
+            return
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        # cache what was just written instead of reading it back
+        _fill_cache_nolock(_users_key(path), blob)
+
+    fsync_dir(path.parent)
+
+
+# Set once web_users.json is known to have users; ensure_bootstrap_admin() is then a no-op
+_BOOTSTRAP_DONE = False
+
+# Serializes every load -> modify -> save of web_users.json (re-entrant: mutators call ensure_bootstrap_admin())
+_WRITE_LOCK = threading.RLock()
+
+
+def _locked(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with _WRITE_LOCK:
+            return fn(*args, **kwargs)
+    return wrapper
 
 
 def ensure_bootstrap_admin() -> None:
@@ -61,66 +159,122 @@ def ensure_bootstrap_admin() -> None:
 
     หมายเหตุ: เพื่อความปลอดภัย ฟังก์ชันนี้จะไม่สร้างบัญชีด้วยรหัสผ่านค่าเริ่มต้น
     หากไม่ได้กำหนด DASHBOARD_ADMIN_PASSWORD ไว้ในระบบ
+
+    Once users are known to exist this is a flag check only
+    (delete_user() re-arms it when the last account is removed).
     """
-    data = load_web_users()
-    users: List[Dict[str, Any]] = data.get("users") or []
-    if users:
+    global _BOOTSTRAP_DONE
+    if _BOOTSTRAP_DONE:
         return
+    with _WRITE_LOCK:
+        if _BOOTSTRAP_DONE:
+            return
+        if _cache_entry()["users_by_name"]:
+            _BOOTSTRAP_DONE = True
+            return
+        data = load_web_users()
+        users: List[Dict[str, Any]] = data.get("users") or []
+
+        super_user = (os.getenv("DASHBOARD_ADMIN_USER") or "superadmin").strip() or "superadmin"
+        super_pass = os.getenv("DASHBOARD_ADMIN_PASSWORD")
+        if not super_pass:
+            return  # not done: retry once a password is configured or a user is added
+
+        users.append(
+            {
+                "username": super_user,
+                "role": ROLE_SUPERADMIN,
+                "password_hash": _hash_password(super_pass),
+                "created_at": _now_iso(),
+            }
+        )
+        data["users"] = users
+        save_web_users(data)
+        _BOOTSTRAP_DONE = True
 
-    super_user = (os.getenv("DASHBOARD_ADMIN_USER") or "superadmin").strip() or "superadmin"
-    super_pass = os.getenv("DASHBOARD_ADMIN_PASSWORD")
-    if not super_pass:
-        return
 
-    users.append(
-        {
-            "username": super_user,
-            "role": ROLE_SUPERADMIN,
-            "password_hash": generate_password_hash(super_pass),
-            "created_at": _now_iso(),
-        }
-    )
-    data["users"] = users
-    save_web_users(data)
+def _hash_password(password: str) -> str:
+    return _ARGON2.hash(password) if _ARGON2 is not None else generate_password_hash(password)
+
+
+def _check_password(password_hash: str, password: str) -> bool:
+    """Verify against either hash format: "$argon2..." (argon2-cffi) or werkzeug's "method$salt$hash"."""
+    if not password_hash.startswith("$argon2"):
+        return check_password_hash(password_hash, password)
+    if _ARGON2 is None:
+        return False  # argon2 hash but argon2-cffi not installed
+    try:
+        return _ARGON2.verify(password_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+
+def _needs_rehash(password_hash: str) -> bool:
+    if _ARGON2 is None:
+        return False
+    if not password_hash.startswith("$argon2"):
+        return True
+    try:
+        return _ARGON2.check_needs_rehash(password_hash)
+    except InvalidHashError:
+        return False
+
+
+@_locked
+def _rehash_password(username: str, password: str, old_hash: str) -> None:
+    """Store a fresh argon2 hash for `username` (called after a successful login).
+
+    Skipped if the stored hash is no longer `old_hash` (password changed since it was verified).
+    """
+    data = load_web_users()
+    for u in (data.get("users") or []):
+        if (u.get("username") or "").strip() == username:
+            if (u.get("password_hash") or "") != old_hash:
+                return
+            u["password_hash"] = _hash_password(password)
+            save_web_users(data)
+            return
+
 
 def authenticate(username: str, password: str) -> Optional[Dict[str, Any]]:
     ensure_bootstrap_admin()
     username = (username or "").strip()
     password = password or ""
-    data = load_web_users()
-    for u in (data.get("users") or []):
-        if (u.get("username") or "").strip() == username:
-            if check_password_hash(u.get("password_hash") or "", password):
-                role = (u.get("role") or ROLE_ADMIN).strip().lower()
-                return {"username": username, "role": role}
-            return None
+    u = _cache_entry()["users_by_name"].get(username)
+    if u is None:
+        return None
+    password_hash = u.get("password_hash") or ""
+    if _check_password(password_hash, password):
+        if _needs_rehash(password_hash):
+            # one-time upgrade of werkzeug (or outdated argon2) hashes while the password is at hand
+            try:
+                _rehash_password(username, password, password_hash)
+            except Exception:
+                pass  # upgrade is best-effort: login still succeeds, retried next time
+        role = (u.get("role") or ROLE_ADMIN).strip().lower()
+        return {"username": username, "role": role}
     return None
 
-def list_users() -> List[Dict[str, Any]]:
-    ensure_bootstrap_admin()
-    data = load_web_users()
-    users = data.get("users") or []
 
-    # sort: superadmin first, then admin, then username
-    def key(u: Dict[str, Any]):
-        r = (u.get("role") or "").strip().lower()
-        bucket = 0 if r == ROLE_SUPERADMIN else (1 if r == ROLE_ADMIN else 2)
-        return (bucket, (u.get("username") or ""))
+def list_users() -> List[Dict[str, Any]]:
+    """Users sorted superadmin -> admin -> others, then by username.
 
-    return sorted(users, key=key)
+    The list is a copy; the records are shared with the cache: read them, never mutate.
+    """
+    ensure_bootstrap_admin()
+    return list(_cache_entry()["sorted_users"])
 
 
 def get_user_record(username: str) -> Optional[Dict[str, Any]]:
-    """Return the raw user record (including extra fields) from web_users.json."""
+    """Return the raw user record (including extra fields) from web_users.json.
+
+    The record is shared with the cache: read it, never mutate it.
+    """
     ensure_bootstrap_admin()
     username = (username or "").strip()
     if not username:
         return None
-    data = load_web_users()
-    for u in (data.get("users") or []):
-        if (u.get("username") or "").strip() == username:
-            return u
-    return None
+    return _cache_entry()["users_by_name"].get(username)
 
 
 def get_user_device_group_ids(username: str) -> List[str]:
@@ -145,6 +299,7 @@ def get_user_device_group_ids(username: str) -> List[str]:
     return out
 
 
+@_locked
 def set_user_device_group_ids(username: str, group_ids: List[str]) -> None:
     """Set device group access for a given web user (admin).
 
@@ -180,6 +335,8 @@ def set_user_device_group_ids(username: str, group_ids: List[str]) -> None:
     target["device_group_ids"] = norm
     save_web_users(data)
 
+
+@_locked
 def add_user(
     username: str,
     password: str,
@@ -198,15 +355,16 @@ def add_user(
     if role not in ALLOWED_ROLES:
         raise ValueError("invalid role")
 
-    data = load_web_users()
-    users = data.get("users") or []
-    if any((u.get("username") or "").strip() == username for u in users):
+    entry = _cache_entry()
+    if username in entry["users_by_name"]:
         raise ValueError("username already exists")
+    data = _parse_web_users(entry["raw"])
+    users = data.get("users") or []
 
     rec: Dict[str, Any] = {
         "username": username,
         "role": role,
-        "password_hash": generate_password_hash(password),
+        "password_hash": _hash_password(password),
         "created_at": _now_iso(),
     }
 
@@ -226,6 +384,7 @@ def add_user(
     save_web_users(data)
 
 
+@_locked
 def set_user_name(username: str, first_name: str = "", last_name: str = "") -> None:
     """Update optional first/last name fields for a web account.
 
@@ -259,18 +418,22 @@ def set_user_name(username: str, first_name: str = "", last_name: str = "") -> N
 
     save_web_users(data)
 
+
+@_locked
 def delete_user(username: str) -> bool:
+    global _BOOTSTRAP_DONE
     ensure_bootstrap_admin()
     username = (username or "").strip()
     if not username:
         return False
-    data = load_web_users()
-    users = data.get("users") or []
-    before = len(users)
-    data["users"] = [u for u in users if (u.get("username") or "").strip() != username]
-    if len(data["users"]) == before:
+    entry = _cache_entry()
+    if username not in entry["users_by_name"]:
         return False
+    data = _parse_web_users(entry["raw"])
+    data["users"] = [u for u in (data.get("users") or []) if (u.get("username") or "").strip() != username]
     save_web_users(data)
+    if not data["users"]:
+        _BOOTSTRAP_DONE = False  # last account gone: bootstrap again on next call
     return True
 
 
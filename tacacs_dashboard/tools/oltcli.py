@@ -1,19 +1,15 @@
 #!/usr/bin/env python3
+from __future__ import annotations
+
 import json
 import os
 import sys
-import re
 import getpass
 import pexpect
 
+from tacacs_dashboard.services._cli_patterns import DENIED_RE, LOGIN_RE, MORE_RE, PASS_RE, PROMPT_RE
 from tacacs_dashboard.services.privilege import parse_privilege
 
-PROMPT_RE = re.compile(r"[>#]\s*$", re.M)
-PASS_RE = re.compile(r"(?i)password:")
-LOGIN_RE = re.compile(r"(?i)(username:|login:)")
-DENIED_RE = re.compile(r"(?i)(denied|failed|incorrect|invalid|not authorized)")
-MORE_RE = re.compile(r"--More--")
-
 ROLE_TO_ENABLE = {"OLT_VIEW": 1, "OLT_ENGINEER": 7, "OLT_ADMIN": 15}
 
 
@@ -22,18 +18,31 @@ def load_policy(path: str) -> dict:
         return json.load(f)
 
 
-def role_of_user(policy: dict, username: str) -> str:
+def index_policy(policy: dict) -> dict:
+    """users by username.lower() / roles by name.upper() (first match wins)."""
+    users_by_lower: dict = {}
     for u in policy.get("users", []):
-        if u.get("username", "").lower() == username.lower():
-            return u.get("roles", "")
-    raise SystemExit(f"User {username} not found in policy.json")
+        users_by_lower.setdefault(u.get("username", "").lower(), u)
+    roles_by_upper: dict = {}
+    for r in policy.get("roles", []):
+        roles_by_upper.setdefault(r.get("name", "").upper(), r)
+    return {"users_by_lower": users_by_lower, "roles_by_upper": roles_by_upper}
 
 
-def enable_level_for_role(policy: dict, role: str) -> int:
+def role_of_user(policy: dict, username: str, index: dict | None = None) -> str:
+    index = index or index_policy(policy)
+    u = index["users_by_lower"].get(username.lower())
+    if u is None:
+        raise SystemExit(f"User {username} not found in policy.json")
+    return u.get("roles", "")
+
+
+def enable_level_for_role(policy: dict, role: str, index: dict | None = None) -> int:
     # ใช้ privilege ใน policy roles ก่อน ถ้าไม่มีค่อย fallback mapping
-    for r in policy.get("roles", []):
-        if r.get("name", "").upper() == role.upper():
-            return parse_privilege(r.get("privilege"), default=15)
+    index = index or index_policy(policy)
+    r = index["roles_by_upper"].get(role.upper())
+    if r is not None:
+        return parse_privilege(r.get("privilege"), default=15)
     return int(ROLE_TO_ENABLE.get(role.upper(), 15))
 
 
@@ -65,8 +74,9 @@ def main():
     policy_path = os.environ.get("POLICY_JSON", "./policy.json")
     policy = load_policy(policy_path)
 
-    role = role_of_user(policy, username)
-    level = enable_level_for_role(policy, role)
+    index = index_policy(policy)
+    role = role_of_user(policy, username, index)
+    level = enable_level_for_role(policy, role, index)
 
     print(f"[oltcli] user={username} role={role} -> enable {level}")
 